@@ -60,6 +60,11 @@ class API(wsgi.Router):
                                  action="create_rush",
                                  conditions={'method': 'PUT'})
 
+            ac_mapper.connect("batch",
+                                 "/batch",
+                                 action="batch",
+                                 conditions={'method': 'POST'})
+
             ac_mapper.connect("delete",
                                  "/{rush_id}",
                                  action="delete_rush",
@@ -56,8 +56,32 @@ class RushController(object):
     def get_list(self, req):
         """
         Get status of RUSH service for this tenant and id
+        Accepts the limit, marker, status (may be repeated), type and
+        fields (comma separated) query parameters
         """
-        return self.engine.get_list(req.context,req.context.tenant_id)
+        params = req.params
+        try:
+            limit = int(params['limit']) if 'limit' in params else None
+            rush_type_id = int(params['type']) if 'type' in params else None
+        except ValueError:
+            raise exc.HTTPBadRequest(_('limit and type must be integers'))
+        if limit is not None and limit <= 0:
+            raise exc.HTTPBadRequest(_('limit must be a positive integer'))
+
+        status = params.getall('status') or None
+        fields = params['fields'].split(',') if 'fields' in params else None
+        if fields is not None:
+            unknown = [f for f in fields if f not in engine_api.RUSH_LIST_FIELDS]
+            if unknown:
+                raise exc.HTTPBadRequest(
+                    _('fields must be a comma separated list of: %s') %
+                    ', '.join(engine_api.RUSH_LIST_FIELDS))
+        return self.engine.get_list(req.context,req.context.tenant_id,
+                                    limit=limit,
+                                    marker=params.get('marker'),
+                                    status=status,
+                                    rush_type_id=rush_type_id,
+                                    fields=fields)
     
     @util.tenant_local
     def create_rush(self, req, body={}):
@@ -67,6 +91,15 @@ class RushController(object):
         """
         return self.engine.start_rush_stack(req.context,req.context.tenant_id,body['rush_type_id'],body['rush_name'])
     
+    @util.tenant_local
+    def batch(self, req, body={}):
+        """
+        Run several RUSH operations for this tenant in one request
+        Body must contain the list of operations, each one with its action
+        (create, delete or get) and the arguments of that action
+        """
+        return self.engine.batch_rush_operations(req.context,req.context.tenant_id,body['operations'])
+
     @util.identified_rush
     def delete_rush(self, req):
         """
@@ -13,6 +13,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+
 from oslo.config import cfg
 
 from rushstack.openstack.common import local
@@ -64,6 +66,9 @@ class RequestContext(context.RequestContext):
         if overwrite or not hasattr(local.store, 'context'):
             self.update_store()
         self._session = None
+        # Set to run the read only queries on the master, e.g. to check
+        # a rush before changing it
+        self.read_from_master = False
 
     def update_store(self):
         local.store.context = self
@@ -74,6 +79,25 @@ class RequestContext(context.RequestContext):
             self._session = db_api.get_session()
         return self._session
 
+    @property
+    def in_transaction(self):
+        return self._session is not None and \
+            self._session.transaction is not None
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Scope whose DB writes through this context are committed together
+        when it ends, or rolled back if it raises. Scopes can be nested,
+        the outermost one commits.
+
+            with ctxt.transaction():
+                db_api.rush_stack_create(ctxt, values)
+                db_api.rush_pool_delete(ctxt, pool_id)
+        """
+        with db_api.transaction(self) as session:
+            yield session
+
     def to_dict(self):
         return {'auth_token': self.auth_token,
                 'username': self.user,
@@ -274,3 +274,12 @@ class ResourceFailure(OpenstackException):
 
 class NotSupported(OpenstackException):
     message = _("%(feature)s is not supported.")
+
+
+class EndpointUnavailable(OpenstackException):
+    message = _("The %(endpoint)s endpoint is unavailable, retry later.")
+
+
+class EndpointTimeout(OpenstackException):
+    message = _("The %(endpoint)s endpoint did not answer within "
+                "%(timeout).1f seconds.")
@@ -26,40 +26,112 @@ The underlying driver is loaded . SQLAlchemy is currently the only
 supported backend.
 '''
 
+import contextlib
+
+from eventlet import tpool
 from oslo.config import cfg
 
 from rushstack.db import utils
 
 SQL_CONNECTION = 'sqlite://'
+SQL_READ_CONNECTIONS = []
 SQL_IDLE_TIMEOUT = 3600
 db_opts = [
     cfg.StrOpt('db_backend',
                default='sqlalchemy',
-               help='The backend to use for db')]
+               help='The backend to use for db'),
+    cfg.BoolOpt('db_use_tpool',
+                default=False,
+                help='Run the DB calls in a pool of native threads, so that '
+                     'a blocking DB driver (e.g. MySQL-python) does not '
+                     'stall the other green threads'),
+    cfg.IntOpt('db_tpool_size',
+               default=20,
+               help='Number of native threads of the DB thread pool')]
 
 cfg.CONF.register_opts(db_opts)
 
-IMPL = utils.LazyPluggable('db_backend',
-                           sqlalchemy='rushstack.db.sqlalchemy.api')
+
+class DBBackend(object):
+    """
+    The DB backend, whose functions run in the eventlet thread pool when
+    db_use_tpool is set. They must return plain values or loaded model
+    objects, never queries, so no SQL runs outside the pool.
+    """
+
+    def __init__(self, backend):
+        self.__backend = backend
+        self.__impl = None
+
+    def __get_impl(self):
+        if self.__impl is None:
+            if cfg.CONF.db_use_tpool:
+                tpool.set_num_threads(cfg.CONF.db_tpool_size)
+                self.__impl = tpool.Proxy(self.__backend)
+            else:
+                self.__impl = self.__backend
+        return self.__impl
+
+    def __getattr__(self, key):
+        return getattr(self.__get_impl(), key)
+
+
+IMPL = DBBackend(utils.LazyPluggable('db_backend',
+                                     sqlalchemy='rushstack.db.sqlalchemy.api'))
 
 
 cfg.CONF.import_opt('sql_connection', 'rushstack.openstack.common.config')
 cfg.CONF.import_opt('sql_idle_timeout', 'rushstack.openstack.common.config')
+cfg.CONF.import_opt('sql_read_connection', 'rushstack.openstack.common.config')
 
 
 def configure():
     global SQL_CONNECTION
+    global SQL_READ_CONNECTIONS
     global SQL_IDLE_TIMEOUT
     SQL_CONNECTION = cfg.CONF.sql_connection
+    SQL_READ_CONNECTIONS = cfg.CONF.sql_read_connection
     SQL_IDLE_TIMEOUT = cfg.CONF.sql_idle_timeout
 
 def get_session():
     return IMPL.get_session()
 
+def reset():
+    return IMPL.reset()
+
+@contextlib.contextmanager
+def transaction(context):
+    """
+    Scope whose DB writes through the context are committed together when
+    it ends, or rolled back if it raises (see RequestContext.transaction).
+    Begin, commit and rollback go through the backend like any other DB
+    call, so they run in the thread pool when db_use_tpool is set.
+    """
+    transaction = IMPL.transaction_begin(context)
+    try:
+        yield context.session
+        IMPL.transaction_commit(context, transaction)
+    except:
+        #Also on BaseException, e.g. an eventlet Timeout
+        IMPL.transaction_rollback(context, transaction)
+        raise
+
 
 def rush_tenant_get_all_by_tenant(context, tenant_id):
     return IMPL.rush_tenant_get_all_by_tenant(context, tenant_id)
 
+def rush_stack_get_all_by_tenant(context, tenant_id, status=None,
+                                 rush_type_id=None, limit=None, marker=None):
+    return IMPL.rush_stack_get_all_by_tenant(context, tenant_id, status=status,
+                                             rush_type_id=rush_type_id,
+                                             limit=limit, marker=marker)
+
+def rush_stack_get_all_unsettled(context, settled_status):
+    return IMPL.rush_stack_get_all_unsettled(context, settled_status)
+
+def rush_stack_get_all(context):
+    return IMPL.rush_stack_get_all(context)
+
 def rush_tenant_create(context, values):
     return IMPL.rush_tenant_create(context, values)
 
@@ -69,12 +141,72 @@ def rush_stack_create(context, values):
 def rush_type_get(context, type_id):
     return IMPL.rush_type_get(context, type_id)
 
+def rush_type_get_all(context):
+    return IMPL.rush_type_get_all(context)
+
+def rush_type_get_versions(context):
+    return IMPL.rush_type_get_versions(context)
+
 def rush_stack_get(context, rush_id):
     return IMPL.rush_stack_get(context, rush_id)
 
 def rush_stack_update(context, rush_id, values):
     return IMPL.rush_stack_update(context, rush_id, values)
 
+def rush_tenant_get_tenant_ids(context, rush_ids):
+    return IMPL.rush_tenant_get_tenant_ids(context, rush_ids)
+
 def rush_tenant_get_by_rush_and_tenant(context, rush_id, tenant_id):
     return IMPL.rush_tenant_get_by_rush_and_tenant(context, rush_id, tenant_id)
 
+def rush_stack_update_many(context, updates):
+    return IMPL.rush_stack_update_many(context, updates)
+
+def rush_stack_purge(context, rush_ids):
+    return IMPL.rush_stack_purge(context, rush_ids)
+
+def rush_stack_create_for_tenant(context, values, tenant_id, task_values=None):
+    return IMPL.rush_stack_create_for_tenant(context, values, tenant_id, task_values)
+
+def rush_pool_create(context, values):
+    return IMPL.rush_pool_create(context, values)
+
+def rush_pool_get_all_unclaimed(context, rush_type_id=None):
+    return IMPL.rush_pool_get_all_unclaimed(context, rush_type_id=rush_type_id)
+
+def rush_pool_get_all_claimed(context, before):
+    return IMPL.rush_pool_get_all_claimed(context, before)
+
+def rush_pool_claim(context, rush_type_id, rush_id, status):
+    return IMPL.rush_pool_claim(context, rush_type_id, rush_id, status)
+
+def rush_pool_update(context, pool_id, values):
+    return IMPL.rush_pool_update(context, pool_id, values)
+
+def rush_pool_delete(context, pool_id):
+    return IMPL.rush_pool_delete(context, pool_id)
+
+def rush_task_create(context, values, rush_values=None):
+    return IMPL.rush_task_create(context, values, rush_values)
+
+def rush_task_claim(context, owner, lease, limit, states, claimed_state):
+    return IMPL.rush_task_claim(context, owner, lease, limit, states,
+                                claimed_state)
+
+def rush_task_update(context, task_id, owner, values):
+    return IMPL.rush_task_update(context, task_id, owner, values)
+
+def rush_task_delete(context, task_id, owner):
+    return IMPL.rush_task_delete(context, task_id, owner)
+
+def rush_task_get_rush_ids(context, action, states):
+    return IMPL.rush_task_get_rush_ids(context, action, states)
+
+def rush_task_count_by_state(context):
+    return IMPL.rush_task_count_by_state(context)
+
+def engine_lease_acquire(context, name, owner, duration):
+    return IMPL.engine_lease_acquire(context, name, owner, duration)
+
+def engine_lease_release(context, name, owner):
+    return IMPL.engine_lease_release(context, name, owner)
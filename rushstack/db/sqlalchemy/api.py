@@ -14,16 +14,29 @@
 #    under the License.
 
 '''Implementation of SQLAlchemy backend.'''
+import datetime
+
+import sqlalchemy
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.session import Session
 
 from rushstack.common import crypt
 from rushstack.openstack.common import exception
+from rushstack.openstack.common import timeutils
 from rushstack.db.sqlalchemy import models
+from rushstack.db.sqlalchemy import session as db_session
 from rushstack.db.sqlalchemy.session import get_session
 
 
-def model_query(context, *args):
-    session = _session(context)
+def model_query(context, *args, **kwargs):
+    '''
+    :param read_only: True to run the query on a read replica if possible
+                      (see _read_session)
+    '''
+    if kwargs.get('read_only'):
+        session = _read_session(context)
+    else:
+        session = _session(context)
     query = session.query(*args)
 
     return query
@@ -32,17 +45,138 @@ def model_query(context, *args):
 def _session(context):
     return (context and context.session) or get_session()
 
+def _read_session(context):
+    '''
+    Session for a read only query: the context one when the context asks
+    for reads from the master or is in a transaction, a replica one
+    otherwise (see db_session.get_read_session)
+    '''
+    if context and (context.read_from_master or context.in_transaction):
+        return context.session
+    return db_session.get_read_session()
+
+def _read_or_master(context, query):
+    '''
+    Return query(read_only=True) or, when the read found nothing and may
+    have run on a replica, query(read_only=False). A replica may not have
+    the rows written a moment ago by another engine or worker yet.
+    '''
+    result = query(True)
+    if (result is None and db_session.has_read_replicas() and
+            not (context and (context.read_from_master or
+                              context.in_transaction))):
+        result = query(False)
+    return result
+
+def reset():
+    db_session.reset()
+
+def transaction_begin(context):
+    '''
+    Begin a transaction, or a subtransaction of the running one, on the
+    session of the context
+    '''
+    return _session(context).begin(subtransactions=True)
+
+def transaction_commit(context, transaction):
+    transaction.commit()
+
+def transaction_rollback(context, transaction):
+    transaction.rollback()
+
 def rush_tenant_get_all_by_tenant(context, tenant_id):
-    result = model_query(context, models.RushTenant).\
+    result = model_query(context, models.RushTenant, read_only=True).\
         filter_by(tenant_id=tenant_id)
 
-    return result
+    return result.all()
+
+def rush_stack_get_all_by_tenant(context, tenant_id, status=None,
+                                 rush_type_id=None, limit=None, marker=None):
+    '''
+    Get the rushes of a tenant joined through rush_tenant in a single query,
+    ordered by creation time.
+
+    :param status: status or list of statuses to filter by
+    :param rush_type_id: rush type to filter by
+    :param limit: maximum number of rushes to return
+    :param marker: id of the last rush of the previous page
+    '''
+    query = model_query(context, models.RushStack, read_only=True).\
+        join(models.RushTenant,
+             models.RushTenant.rush_id == models.RushStack.id).\
+        filter(models.RushTenant.tenant_id == tenant_id)
+
+    if status is not None:
+        if isinstance(status, basestring):
+            status = [status]
+        query = query.filter(models.RushStack.status.in_(status))
+
+    if rush_type_id is not None:
+        query = query.filter_by(rush_type_id=rush_type_id)
+
+    if marker is not None:
+        marker_ref = rush_stack_get(context, marker)
+        if not marker_ref:
+            raise exception.NotFound('Marker rush %s not found' % marker)
+        query = query.filter(sqlalchemy.or_(
+            models.RushStack.created_at > marker_ref.created_at,
+            sqlalchemy.and_(models.RushStack.created_at == marker_ref.created_at,
+                            models.RushStack.id > marker_ref.id)))
+
+    query = query.order_by(models.RushStack.created_at, models.RushStack.id)
+    if limit is not None:
+        query = query.limit(limit)
+
+    return query.all()
+
+def rush_stack_get_all_unsettled(context, settled_status):
+    '''
+    Get the rushes HEAT may still change: those whose status is not one of
+    settled_status, plus the complete ones without endpoint yet.
+
+    "status NOT IN settled_status" is read as the status ranges between
+    the settled ones, and each range or lookup is a query of its own in a
+    UNION ALL, so that every one of them is an index range scan on
+    ix_rush_stack_status_url instead of a scan of the whole table.
+    '''
+    if not settled_status:
+        return model_query(context, models.RushStack).all()
+    status = models.RushStack.status
+    settled_status = sorted(set(settled_status))
+    ranges = [status < settled_status[0]]
+    for low, high in zip(settled_status, settled_status[1:]):
+        ranges.append(sqlalchemy.and_(status > low, status < high))
+    ranges.append(status > settled_status[-1])
+    if 'CREATE_COMPLETE' in settled_status:
+        ranges.append(sqlalchemy.and_(status == 'CREATE_COMPLETE',
+                                      models.RushStack.url == None))
+
+    queries = [model_query(context, models.RushStack).filter(criterion)
+               for criterion in ranges]
+    return queries[0].union_all(*queries[1:]).all()
+
+def rush_stack_get_all(context):
+    '''
+    Get all the rushes, for the periodic HEAT check of the settled ones
+    '''
+    return model_query(context, models.RushStack).all()
 
 def rush_tenant_get_by_rush_and_tenant(context, rush_id, tenant_id):
-    result = model_query(context, models.RushTenant).\
-        filter_by(tenant_id=tenant_id,rush_id=rush_id)
+    return _read_or_master(context, lambda read_only:
+        model_query(context, models.RushTenant, read_only=read_only).\
+            filter_by(tenant_id=tenant_id,rush_id=rush_id).first())
 
-    return result
+def rush_tenant_get_tenant_ids(context, rush_ids):
+    '''
+    Get the tenant owning each of the rushes, as a dict of rush_id: tenant_id
+    '''
+    if not rush_ids:
+        return {}
+    result = model_query(context, models.RushTenant.rush_id,
+                         models.RushTenant.tenant_id).\
+        filter(models.RushTenant.rush_id.in_(rush_ids))
+
+    return dict(result.all())
 
 def rush_stack_create(context, values):
     rush_stack_ref = models.RushStack()
@@ -57,13 +191,27 @@ def rush_tenant_create(context, values):
     return rush_tenant_ref
 
 def rush_type_get(context, type_id):
-    return model_query(context, models.RushType).get(type_id)
+    return model_query(context, models.RushType, read_only=True).get(type_id)
+
+def rush_type_get_all(context):
+    return model_query(context, models.RushType, read_only=True).all()
+
+def rush_type_get_versions(context):
+    '''
+    Get (id, created_at, updated_at) of every rush type, without loading
+    the templates
+    '''
+    return model_query(context, models.RushType.id,
+                       models.RushType.created_at,
+                       models.RushType.updated_at, read_only=True).all()
 
 def rush_stack_get(context, rush_id):
-    return model_query(context, models.RushStack).get(rush_id)
+    return _read_or_master(context, lambda read_only:
+        model_query(context, models.RushStack,
+                    read_only=read_only).get(rush_id))
 
 def rush_stack_update(context, rush_id, values):
-    rushstack = rush_stack_get(context, rush_id)
+    rushstack = model_query(context, models.RushStack).get(rush_id)
 
     if not rushstack:
         raise exception.NotFound('Attempt to update a rushstack with id: %s %s' %
@@ -71,3 +219,281 @@ def rush_stack_update(context, rush_id, values):
 
     rushstack.update(values)
     rushstack.save(_session(context))
+
+def rush_stack_update_many(context, updates):
+    '''
+    Update many rushes in a single transaction with set based statements.
+    The rushes getting the same values share an UPDATE ... WHERE id IN,
+    the others (e.g. each with its own url) are grouped by updated
+    columns into executemany UPDATEs.
+
+    :param updates: dict of rush_id: values
+    '''
+    if not updates:
+        return
+    now = timeutils.utcnow()
+    table = models.RushStack.__table__
+
+    by_values = {}
+    same_columns = {}
+    for rush_id, values in updates.iteritems():
+        try:
+            key = tuple(sorted(values.iteritems()))
+            hash(key)
+        except TypeError:
+            #Unhashable values, e.g. extdata documents
+            key = None
+        if key is None:
+            same_columns.setdefault(tuple(sorted(values)), []).append(
+                (rush_id, values))
+        else:
+            by_values.setdefault(key, []).append((rush_id, values))
+
+    same_values = {}
+    for key, rows in by_values.iteritems():
+        if len(rows) > 1:
+            same_values[key] = [rush_id for rush_id, values in rows]
+        else:
+            same_columns.setdefault(tuple(sorted(rows[0][1])), []).extend(
+                rows)
+
+    session = _session(context)
+    with session.begin(subtransactions=True):
+        for key, rush_ids in same_values.iteritems():
+            session.execute(table.update().
+                            where(table.c.id.in_(rush_ids)).
+                            values(dict(key, updated_at=now)))
+        for columns, rows in same_columns.iteritems():
+            columns += ('updated_at',)
+            statement = table.update().\
+                where(table.c.id == sqlalchemy.bindparam('_id')).\
+                values(dict((column, sqlalchemy.bindparam(
+                    '_' + column, type_=table.c[column].type))
+                    for column in columns))
+            params = []
+            for rush_id, values in rows:
+                row = dict(('_' + column, value)
+                           for column, value in values.iteritems())
+                row.update({'_id': rush_id, '_updated_at': now})
+                params.append(row)
+            session.execute(statement, params)
+
+def rush_stack_purge(context, rush_ids):
+    '''
+    Delete the rushes and their rush_tenant rows in a single transaction.
+    '''
+    if not rush_ids:
+        return
+    session = _session(context)
+    with session.begin(subtransactions=True):
+        session.query(models.RushTenant).\
+            filter(models.RushTenant.rush_id.in_(rush_ids)).\
+            delete(synchronize_session=False)
+        session.query(models.RushStack).\
+            filter(models.RushStack.id.in_(rush_ids)).\
+            delete(synchronize_session=False)
+
+def rush_stack_create_for_tenant(context, values, tenant_id,
+                                 task_values=None):
+    '''
+    Create the rush, its rush_tenant row and, if task_values is given, the
+    task that will carry on its creation, in a single transaction.
+    '''
+    session = _session(context)
+    with session.begin(subtransactions=True):
+        rush_stack_ref = models.RushStack()
+        rush_stack_ref.update(values)
+        session.add(rush_stack_ref)
+        #No relationship orders the INSERTs: the rush_tenant row must not
+        #reach the DB before the rush_stack row its foreign key points to
+        session.flush()
+        rush_tenant_ref = models.RushTenant()
+        rush_tenant_ref.update({'rush_id': values['id'],
+                                'tenant_id': tenant_id})
+        session.add(rush_tenant_ref)
+        if task_values is not None:
+            rush_task_ref = models.RushTask()
+            rush_task_ref.update(task_values)
+            session.add(rush_task_ref)
+    return rush_stack_ref
+
+def rush_pool_create(context, values):
+    rush_pool_ref = models.RushPool()
+    rush_pool_ref.update(values)
+    rush_pool_ref.save(_session(context))
+    return rush_pool_ref
+
+def rush_pool_get_all_unclaimed(context, rush_type_id=None):
+    result = model_query(context, models.RushPool).\
+        filter_by(rush_id=None)
+    if rush_type_id is not None:
+        result = result.filter_by(rush_type_id=rush_type_id)
+
+    return result.order_by(models.RushPool.created_at).all()
+
+def rush_pool_get_all_claimed(context, before):
+    '''
+    Get the pool stacks claimed before the given time and still in the
+    pool: their claim was never completed
+    '''
+    return model_query(context, models.RushPool).\
+        filter(models.RushPool.rush_id != None).\
+        filter(models.RushPool.updated_at < before).all()
+
+def rush_pool_claim(context, rush_type_id, rush_id, status):
+    '''
+    Atomically assign to rush_id the oldest unclaimed pool stack of the
+    rush type that is in the given status.
+
+    Returns: the claimed RushPool, or None if there was none left
+    '''
+    candidates = model_query(context, models.RushPool.id).\
+        filter_by(rush_type_id=rush_type_id, rush_id=None, status=status).\
+        order_by(models.RushPool.created_at).limit(5).all()
+
+    for (pool_id,) in candidates:
+        #Only one engine can win the update of a given row
+        claimed = model_query(context, models.RushPool).\
+            filter_by(id=pool_id, rush_id=None).\
+            update({'rush_id': rush_id}, synchronize_session=False)
+        if claimed:
+            #The session may hold the row as it was before the update
+            return model_query(context, models.RushPool).\
+                populate_existing().get(pool_id)
+    return None
+
+def rush_pool_update(context, pool_id, values):
+    rush_pool = model_query(context, models.RushPool).get(pool_id)
+
+    if not rush_pool:
+        raise exception.NotFound('Attempt to update a pool stack with id: %s %s' %
+                                 (pool_id, 'that does not exist'))
+
+    rush_pool.update(values)
+    rush_pool.save(_session(context))
+
+def rush_pool_delete(context, pool_id):
+    model_query(context, models.RushPool).\
+        filter_by(id=pool_id).delete(synchronize_session=False)
+
+def rush_task_create(context, values, rush_values=None):
+    '''
+    Create a task and, in the same transaction, update its rush with
+    rush_values when given.
+    '''
+    session = _session(context)
+    with session.begin(subtransactions=True):
+        if rush_values is not None:
+            session.query(models.RushStack).\
+                filter_by(id=values['rush_id']).\
+                update(rush_values, synchronize_session=False)
+        rush_task_ref = models.RushTask()
+        rush_task_ref.update(values)
+        session.add(rush_task_ref)
+    return rush_task_ref
+
+def rush_task_claim(context, owner, lease, limit, states, claimed_state):
+    '''
+    Lease to owner for lease seconds, and move to claimed_state, up to
+    limit runnable tasks: those in one of states whose lease_expires_at
+    (the lease of a running task or the retry time of a pending one) is
+    not set or has passed.
+
+    Returns: the claimed RushTask rows, oldest first
+    '''
+    now = timeutils.utcnow()
+    runnable = sqlalchemy.and_(
+        models.RushTask.state.in_(states),
+        sqlalchemy.or_(models.RushTask.lease_expires_at == None,
+                       models.RushTask.lease_expires_at < now))
+
+    candidates = model_query(context, models.RushTask.id).\
+        filter(runnable).\
+        order_by(models.RushTask.created_at).limit(limit).all()
+
+    claimed = []
+    for (task_id,) in candidates:
+        #Only one engine can win the update of a given row
+        won = model_query(context, models.RushTask).\
+            filter(models.RushTask.id == task_id).filter(runnable).\
+            update({'state': claimed_state,
+                    'lease_owner': owner,
+                    'lease_expires_at': now + datetime.timedelta(seconds=lease),
+                    'attempts': models.RushTask.attempts + 1},
+                   synchronize_session=False)
+        if won:
+            #The session may hold the row as it was before the update
+            claimed.append(model_query(context, models.RushTask).
+                           populate_existing().get(task_id))
+    return claimed
+
+def rush_task_update(context, task_id, owner, values):
+    '''
+    Update the task if owner still holds its lease.
+
+    Returns: True if the task was updated
+    '''
+    values = dict(values, updated_at=timeutils.utcnow())
+    updated = model_query(context, models.RushTask).\
+        filter_by(id=task_id, lease_owner=owner).\
+        update(values, synchronize_session=False)
+    return bool(updated)
+
+def rush_task_delete(context, task_id, owner):
+    model_query(context, models.RushTask).\
+        filter_by(id=task_id, lease_owner=owner).\
+        delete(synchronize_session=False)
+
+def rush_task_get_rush_ids(context, action, states):
+    '''
+    Get the ids of the rushes with a task of the action in one of states
+    '''
+    result = model_query(context, models.RushTask.rush_id).\
+        filter(models.RushTask.action == action).\
+        filter(models.RushTask.state.in_(states)).distinct()
+
+    return [rush_id for (rush_id,) in result.all()]
+
+def rush_task_count_by_state(context):
+    return model_query(context, models.RushTask.state,
+                       sqlalchemy.func.count(models.RushTask.id)).\
+        group_by(models.RushTask.state).all()
+
+def engine_lease_acquire(context, name, owner, duration):
+    '''
+    Take or renew for duration seconds the named lease, unless another
+    owner holds it and it has not expired.
+
+    Returns: True if owner holds the lease
+    '''
+    now = timeutils.utcnow()
+    expires_at = now + datetime.timedelta(seconds=duration)
+    acquired = model_query(context, models.EngineLease).\
+        filter(models.EngineLease.name == name).\
+        filter(sqlalchemy.or_(models.EngineLease.owner == owner,
+                              models.EngineLease.expires_at < now)).\
+        update({'owner': owner, 'expires_at': expires_at},
+               synchronize_session=False)
+    if acquired:
+        return True
+
+    if model_query(context, models.EngineLease).get(name) is not None:
+        return False
+    session = _session(context)
+    engine_lease_ref = models.EngineLease()
+    engine_lease_ref.update({'name': name, 'owner': owner,
+                             'expires_at': expires_at})
+    try:
+        engine_lease_ref.save(session)
+    except (exception.Duplicate, IntegrityError):
+        #Another engine created it first. The failed flush has already
+        #expunged the pending lease unless the session is in a transaction
+        if engine_lease_ref in session:
+            session.expunge(engine_lease_ref)
+        return False
+    return True
+
+def engine_lease_release(context, name, owner):
+    model_query(context, models.EngineLease).\
+        filter_by(name=name, owner=owner).\
+        delete(synchronize_session=False)
@@ -0,0 +1,48 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import sqlalchemy
+
+
+def upgrade(migrate_engine):
+    meta = sqlalchemy.MetaData()
+    meta.bind = migrate_engine
+
+    rush_task = sqlalchemy.Table(
+        'rush_task', meta,
+        sqlalchemy.Column('id', sqlalchemy.String(36),
+                          primary_key=True, nullable=False),
+        sqlalchemy.Column('action', sqlalchemy.String(36), nullable=False),
+        sqlalchemy.Column('rush_id', sqlalchemy.String(36), nullable=False),
+        sqlalchemy.Column('tenant_id', sqlalchemy.String(255)),
+        sqlalchemy.Column('payload', sqlalchemy.Text),
+        sqlalchemy.Column('state', sqlalchemy.String(36), nullable=False),
+        sqlalchemy.Column('lease_owner', sqlalchemy.String(255)),
+        sqlalchemy.Column('lease_expires_at', sqlalchemy.DateTime),
+        sqlalchemy.Column('attempts', sqlalchemy.Integer, nullable=False),
+        sqlalchemy.Column('max_attempts', sqlalchemy.Integer, nullable=False),
+        sqlalchemy.Column('last_error', sqlalchemy.Text),
+        sqlalchemy.Column('created_at', sqlalchemy.DateTime),
+        sqlalchemy.Column('updated_at', sqlalchemy.DateTime),
+    )
+
+    rush_task.create()
+
+
+def downgrade(migrate_engine):
+    meta = sqlalchemy.MetaData()
+    meta.bind = migrate_engine
+
+    rush_task = sqlalchemy.Table('rush_task', meta, autoload=True)
+    rush_task.drop()
@@ -0,0 +1,53 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import sqlalchemy
+
+# (index name, table, columns) for the lookups of the engine
+INDEXES = (
+    # rush lists of a tenant
+    ('ix_rush_tenant_tenant_id', 'rush_tenant', ('tenant_id', 'rush_id')),
+    ('ix_rush_stack_created_at', 'rush_stack', ('created_at', 'id')),
+    # stack lookups and the reconciler scan of the unsettled rushes
+    ('ix_rush_stack_stack_id', 'rush_stack', ('stack_id',)),
+    ('ix_rush_stack_status', 'rush_stack', ('status',)),
+    ('ix_rush_stack_rush_type_id', 'rush_stack', ('rush_type_id',)),
+    # warm pool claims and refills
+    ('ix_rush_pool_claim', 'rush_pool', ('rush_type_id', 'rush_id', 'status')),
+    # task queue claims
+    ('ix_rush_task_runnable', 'rush_task', ('state', 'lease_expires_at')),
+)
+
+
+def _indexes(migrate_engine):
+    meta = sqlalchemy.MetaData()
+    meta.bind = migrate_engine
+
+    tables = {}
+    for name, table_name, columns in INDEXES:
+        if table_name not in tables:
+            tables[table_name] = sqlalchemy.Table(table_name, meta,
+                                                  autoload=True)
+        table = tables[table_name]
+        yield sqlalchemy.Index(name, *[table.c[column] for column in columns])
+
+
+def upgrade(migrate_engine):
+    for index in _indexes(migrate_engine):
+        index.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    for index in _indexes(migrate_engine):
+        index.drop(migrate_engine)
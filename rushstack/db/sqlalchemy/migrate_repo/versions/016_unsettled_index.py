@@ -0,0 +1,46 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import sqlalchemy
+
+# The reconciler scan of the unsettled rushes looks up both the status
+# ranges and the complete rushes without url: (status, url) replaces the
+# index on status alone
+INDEX = 'ix_rush_stack_status_url'
+OLD_INDEX = 'ix_rush_stack_status'
+
+
+def _table(migrate_engine):
+    meta = sqlalchemy.MetaData()
+    meta.bind = migrate_engine
+    return sqlalchemy.Table('rush_stack', meta, autoload=True)
+
+
+def upgrade(migrate_engine):
+    rush_stack = _table(migrate_engine)
+    if migrate_engine.name == 'mysql':
+        #url is a TEXT column, MySQL can only index a prefix of it
+        migrate_engine.execute('CREATE INDEX %s ON rush_stack '
+                               '(status, url(255))' % INDEX)
+    else:
+        sqlalchemy.Index(INDEX, rush_stack.c.status,
+                         rush_stack.c.url).create(migrate_engine)
+    sqlalchemy.Index(OLD_INDEX, rush_stack.c.status).drop(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    rush_stack = _table(migrate_engine)
+    sqlalchemy.Index(OLD_INDEX, rush_stack.c.status).create(migrate_engine)
+    sqlalchemy.Index(INDEX, rush_stack.c.status,
+                     rush_stack.c.url).drop(migrate_engine)
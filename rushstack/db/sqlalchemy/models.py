@@ -20,6 +20,7 @@ import sqlalchemy
 from sqlalchemy.orm import relationship, backref, object_mapper
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.mutable import Mutable
 from sqlalchemy import types
 from json import dumps
 from json import loads
@@ -32,14 +33,82 @@ from sqlalchemy.orm.session import Session
 BASE = declarative_base()
 
 
-class Json(types.TypeDecorator, types.MutableType):
+class Json(types.TypeDecorator):
+    """
+    JSON document stored as text. Changes inside the document are not
+    detected, use it through MutableDict.as_mutable(Json) for that.
+    """
     impl = types.Text
 
     def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
         return dumps(value)
 
     def process_result_value(self, value, dialect):
-        return loads(value)
+        if value is None:
+            return None
+        try:
+            return loads(value)
+        except ValueError:
+            #Text stored before the column held JSON
+            return {'text': value}
+
+
+class MutableDict(Mutable, dict):
+    """
+    Dict that flags its parent object as modified when it changes, so a
+    flush only writes the documents that were actually changed.
+
+    Only changes to the dict itself are detected. A change inside a nested
+    value, e.g. extdata['links'].append(link), is not: assign the value
+    again (extdata['links'] = links) or call changed() after it.
+    """
+
+    @classmethod
+    def coerce(cls, key, value):
+        if isinstance(value, MutableDict):
+            return value
+        if isinstance(value, dict):
+            return MutableDict(value)
+        return Mutable.coerce(key, value)
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self.changed()
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self.changed()
+
+    def clear(self):
+        dict.clear(self)
+        self.changed()
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self.changed()
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, *args):
+        result = dict.pop(self, *args)
+        self.changed()
+        return result
+
+    def popitem(self):
+        result = dict.popitem(self)
+        self.changed()
+        return result
+
+    def __getstate__(self):
+        return dict(self)
+
+    def __setstate__(self, state):
+        self.update(state)
 
 
 class RushstackBase(object):
@@ -140,7 +209,9 @@ class RushTenant(BASE, RushstackBase):
     """Represents the relationship between rush id and tenant."""
 
     __tablename__ = 'rush_tenant'
-    rush_id = sqlalchemy.Column(sqlalchemy.String, primary_key=True)
+    rush_id = sqlalchemy.Column(sqlalchemy.String,
+                                sqlalchemy.ForeignKey('rush_stack.id'),
+                                primary_key=True)
     tenant_id = sqlalchemy.Column(sqlalchemy.String,primary_key=True)
 
 class RushType(BASE, RushstackBase):
@@ -160,5 +231,41 @@ class RushStack(BASE, RushstackBase):
     stack_id = sqlalchemy.Column(sqlalchemy.String)
     rush_type_id = sqlalchemy.Column(sqlalchemy.Integer)
     status = sqlalchemy.Column(sqlalchemy.String)
-    extdata = sqlalchemy.Column(sqlalchemy.Text)
+    extdata = sqlalchemy.Column(MutableDict.as_mutable(Json))
     url = sqlalchemy.Column(sqlalchemy.Text)
+
+class RushPool(BASE, RushstackBase):
+    """Represents a stack provisioned in advance for a rush type."""
+
+    __tablename__ = 'rush_pool'
+    id = sqlalchemy.Column(sqlalchemy.String, primary_key=True)
+    rush_type_id = sqlalchemy.Column(sqlalchemy.Integer)
+    stack_id = sqlalchemy.Column(sqlalchemy.String)
+    stack_name = sqlalchemy.Column(sqlalchemy.String)
+    status = sqlalchemy.Column(sqlalchemy.String)
+    extdata = sqlalchemy.Column(MutableDict.as_mutable(Json))
+    rush_id = sqlalchemy.Column(sqlalchemy.String)
+
+class RushTask(BASE, RushstackBase):
+    """Represents a lifecycle operation of a rush run by the engines."""
+
+    __tablename__ = 'rush_task'
+    id = sqlalchemy.Column(sqlalchemy.String, primary_key=True)
+    action = sqlalchemy.Column(sqlalchemy.String)
+    rush_id = sqlalchemy.Column(sqlalchemy.String)
+    tenant_id = sqlalchemy.Column(sqlalchemy.String)
+    payload = sqlalchemy.Column(sqlalchemy.Text)
+    state = sqlalchemy.Column(sqlalchemy.String)
+    lease_owner = sqlalchemy.Column(sqlalchemy.String)
+    lease_expires_at = sqlalchemy.Column(sqlalchemy.DateTime)
+    attempts = sqlalchemy.Column(sqlalchemy.Integer, default=0)
+    max_attempts = sqlalchemy.Column(sqlalchemy.Integer)
+    last_error = sqlalchemy.Column(sqlalchemy.Text)
+
+class EngineLease(BASE, RushstackBase):
+    """Represents a named lease held by one engine, e.g. the leadership."""
+
+    __tablename__ = 'engine_lease'
+    name = sqlalchemy.Column(sqlalchemy.String, primary_key=True)
+    owner = sqlalchemy.Column(sqlalchemy.String)
+    expires_at = sqlalchemy.Column(sqlalchemy.DateTime)
@@ -14,9 +14,14 @@
 
 """Session Handling for SQLAlchemy backend."""
 
+import itertools
+import time
+
+import sqlalchemy.event
 import sqlalchemy.interfaces
 import sqlalchemy.orm
 import sqlalchemy.engine
+from oslo.config import cfg
 from sqlalchemy.exc import DisconnectionError
 
 from rushstack.openstack.common import log as logging
@@ -26,6 +31,15 @@ from rushstack.db import api as db_api
 logger = logging.getLogger(__name__)
 _ENGINE = None
 _MAKER = None
+# Engines and session makers of the read replicas, used in turn
+_READ_ENGINES = None
+_READ_MAKERS = None
+_READ_TURN = itertools.count()
+# Time of the last write of this process
+_LAST_WRITE = 0
+# Engines dropped by reset(), kept referenced so that their connections,
+# which may belong to a parent process, are never closed from here
+_DROPPED_ENGINES = []
 
 
 def get_session(autocommit=True, expire_on_commit=False):
@@ -34,6 +48,10 @@ def get_session(autocommit=True, expire_on_commit=False):
 
     if _MAKER is None:
         _MAKER = get_maker(get_engine(), autocommit, expire_on_commit)
+    if cfg.CONF.db_use_tpool:
+        #A thread of the pool serves many green threads in turn, a
+        #session scoped to it would be shared between their requests
+        return _MAKER.session_factory()
     return _MAKER()
 
 
@@ -70,21 +88,82 @@ def get_engine():
     """Return a SQLAlchemy engine."""
     global _ENGINE
     if _ENGINE is None:
-        connection_dict = sqlalchemy.engine.url.make_url(_get_sql_connection())
-        engine_args = {
-            "pool_recycle": _get_sql_idle_timeout(),
-            "echo": False,
-            'convert_unicode': True
-        }
-
-        if 'mysql' in connection_dict.drivername:
-            engine_args['listeners'] = [MySQLPingListener()]
-
-        _ENGINE = sqlalchemy.create_engine(_get_sql_connection(),
-                                           **engine_args)
+        _ENGINE = _create_engine(_get_sql_connection())
+        sqlalchemy.event.listen(_ENGINE, 'before_cursor_execute',
+                                _record_write)
     return _ENGINE
 
 
+def _create_engine(sql_connection):
+    connection_dict = sqlalchemy.engine.url.make_url(sql_connection)
+    engine_args = {
+        "pool_recycle": _get_sql_idle_timeout(),
+        "echo": False,
+        'convert_unicode': True
+    }
+
+    if 'mysql' in connection_dict.drivername:
+        engine_args['listeners'] = [MySQLPingListener()]
+
+    return sqlalchemy.create_engine(sql_connection, **engine_args)
+
+
+def get_read_session(autocommit=True, expire_on_commit=False):
+    """
+    Return a SQLAlchemy session for read only queries: on one of the read
+    replicas in turn, or on the master when there is none or when this
+    process wrote less than sql_read_after_write_window seconds ago.
+    """
+    global _READ_ENGINES
+    global _READ_MAKERS
+
+    connections = _get_sql_read_connections()
+    if (not connections or
+            time.time() - _LAST_WRITE < cfg.CONF.sql_read_after_write_window):
+        return get_session(autocommit, expire_on_commit)
+
+    if _READ_MAKERS is None:
+        _READ_ENGINES = [_create_engine(connection)
+                         for connection in connections]
+        _READ_MAKERS = [get_maker(engine, autocommit, expire_on_commit)
+                        for engine in _READ_ENGINES]
+    maker = _READ_MAKERS[_READ_TURN.next() % len(_READ_MAKERS)]
+    if cfg.CONF.db_use_tpool:
+        return maker.session_factory()
+    return maker()
+
+
+def has_read_replicas():
+    """Return True when sql_read_connection lists read replicas."""
+    return bool(_get_sql_read_connections())
+
+
+def _record_write(conn, cursor, statement, parameters, context, executemany):
+    global _LAST_WRITE
+
+    if not statement.lstrip()[:6].upper() == 'SELECT':
+        _LAST_WRITE = time.time()
+
+
+def reset():
+    """
+    Forget the engines and sessions, so the next session opens its own
+    connections. A forked process must call it before using the DB.
+    """
+    global _ENGINE
+    global _MAKER
+    global _READ_ENGINES
+    global _READ_MAKERS
+
+    if _ENGINE is not None:
+        _DROPPED_ENGINES.append(_ENGINE)
+    _DROPPED_ENGINES.extend(_READ_ENGINES or [])
+    _ENGINE = None
+    _MAKER = None
+    _READ_ENGINES = None
+    _READ_MAKERS = None
+
+
 def get_maker(engine, autocommit=True, expire_on_commit=False):
     """Return a SQLAlchemy sessionmaker using the given engine."""
     ses = sqlalchemy.orm.sessionmaker(
@@ -98,5 +177,9 @@ def _get_sql_connection():
     return db_api.SQL_CONNECTION
 
 
+def _get_sql_read_connections():
+    return db_api.SQL_READ_CONNECTIONS
+
+
 def _get_sql_idle_timeout():
     return db_api.SQL_IDLE_TIMEOUT
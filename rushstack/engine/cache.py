@@ -0,0 +1,211 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+In-process caches of the engine
+"""
+
+import json
+
+from repoze import lru
+
+from rushstack.db import api as db_api
+from rushstack.openstack.common import log as logging
+
+logger = logging.getLogger(__name__)
+
+
+def rush_type_to_dict(rush_type):
+    '''
+    Rush type with its template prepared for the HEAT stack creation and,
+    when the template is JSON, parsed
+    '''
+    try:
+        parsed = json.loads(rush_type.template)
+    except (TypeError, ValueError):
+        parsed = None
+    return {'id': rush_type.id,
+            'name': rush_type.name,
+            'template': rush_type.template.replace('\n', '\\n'),
+            'parsed_template': parsed,
+            'version': (rush_type.created_at, rush_type.updated_at)}
+
+
+def rush_to_dict(rush_stack, tenant_id):
+    '''
+    Detached copy of a RushStack row and the tenant owning it
+    '''
+    return {'id': rush_stack.id,
+            'name': rush_stack.name,
+            'stack_id': rush_stack.stack_id,
+            'rush_type_id': rush_stack.rush_type_id,
+            'status': rush_stack.status,
+            'url': rush_stack.url,
+            'tenant_id': tenant_id}
+
+
+class RushCache(object):
+    '''
+    Read-through LRU cache of the rushes (RushStack rows with their
+    RushTenant owner) and of the rush lists of the tenants.
+
+    Entries expire after ttl seconds. Whoever changes a rush in the DB
+    must call invalidate() so the next read goes to the DB.
+    '''
+
+    def __init__(self, size, ttl):
+        self._rushes = lru.ExpiringLRUCache(size, default_timeout=ttl)
+        self._lists = lru.ExpiringLRUCache(size, default_timeout=ttl)
+        # tenant_id: generation of the cached lists of the tenant
+        self._generations = {}
+        # rush_id: tenant_id, for the rushes present in a cached list
+        self._owners = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_rush(self, ctxt, tenant_id, rush_id):
+        '''
+        Return the rush as a dict, or None if the tenant has no such rush
+        '''
+        rush = self._rushes.get(rush_id)
+        if rush is not None:
+            self.hits += 1
+            return rush if rush['tenant_id'] == tenant_id else None
+
+        self.misses += 1
+        rush_stack = db_api.rush_stack_get(ctxt, rush_id)
+        if not rush_stack:
+            return None
+        rush_tenant = db_api.rush_tenant_get_by_rush_and_tenant(ctxt, rush_id, tenant_id)
+        if rush_tenant is None:
+            return None
+        rush = rush_to_dict(rush_stack, tenant_id)
+        self._rushes.put(rush_id, rush)
+        return rush
+
+    def get_list(self, ctxt, tenant_id, status=None, rush_type_id=None,
+                 limit=None, marker=None):
+        '''
+        Return the rushes of the tenant as a list of dicts. The filters and
+        pagination arguments are those of
+        db_api.rush_stack_get_all_by_tenant
+        '''
+        if isinstance(status, list):
+            status = tuple(status)
+        key = (tenant_id, self._generations.get(tenant_id, 0),
+               status, rush_type_id, limit, marker)
+        rushes = self._lists.get(key)
+        if rushes is not None:
+            self.hits += 1
+            return rushes
+
+        self.misses += 1
+        rushes = [rush_to_dict(rush_stack, tenant_id) for rush_stack in
+                  db_api.rush_stack_get_all_by_tenant(ctxt, tenant_id,
+                                                      status=status,
+                                                      rush_type_id=rush_type_id,
+                                                      limit=limit,
+                                                      marker=marker)]
+        for rush in rushes:
+            self._owners[rush['id']] = tenant_id
+            self._rushes.put(rush['id'], rush)
+        self._lists.put(key, rushes)
+        return rushes
+
+    def invalidate(self, rush_id, tenant_id=None):
+        '''
+        Drop the cached copies of the rush, including the cached lists of
+        its tenant
+        '''
+        self._rushes.invalidate(rush_id)
+        owner = self._owners.pop(rush_id, None)
+        tenant_id = tenant_id or owner
+        if tenant_id is not None:
+            self._generations[tenant_id] = \
+                self._generations.get(tenant_id, 0) + 1
+
+    def stats(self):
+        '''Return the hit and miss counters of the cache.'''
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': float(self.hits) / lookups if lookups else 0.0}
+
+
+class RushTypeCache(object):
+    '''
+    Cache of all the rush types, holding their templates already prepared
+    for the HEAT stack creation.
+
+    refresh() compares created_at/updated_at of the types in the DB with
+    the cached ones and reloads only those that changed.
+    '''
+
+    def __init__(self):
+        self._types = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, ctxt):
+        '''Load all the rush types from the DB'''
+        self._types = dict((rush_type.id, rush_type_to_dict(rush_type))
+                           for rush_type in db_api.rush_type_get_all(ctxt))
+
+    def refresh(self, ctxt):
+        '''Reload the rush types added, changed or removed in the DB'''
+        versions = dict((type_id, (created_at, updated_at)) for
+                        type_id, created_at, updated_at in
+                        db_api.rush_type_get_versions(ctxt))
+        for type_id in set(self._types) - set(versions):
+            del self._types[type_id]
+        for type_id, version in versions.iteritems():
+            cached = self._types.get(type_id)
+            if cached is None or cached['version'] != version:
+                logger.info('Reloading rush type %s' % type_id)
+                rush_type = db_api.rush_type_get(ctxt, type_id)
+                if rush_type:
+                    self._types[type_id] = rush_type_to_dict(rush_type)
+
+    def get_all(self):
+        '''Return all the cached rush types'''
+        return self._types.values()
+
+    def get(self, ctxt, type_id):
+        '''
+        Return the rush type as a dict, or None if it does not exist
+        '''
+        try:
+            type_id = int(type_id)
+        except (TypeError, ValueError):
+            return None
+
+        rush_type = self._types.get(type_id)
+        if rush_type is not None:
+            self.hits += 1
+            return rush_type
+
+        self.misses += 1
+        rtc = db_api.rush_type_get(ctxt, type_id)
+        if not rtc:
+            return None
+        rush_type = rush_type_to_dict(rtc)
+        self._types[type_id] = rush_type
+        return rush_type
+
+    def stats(self):
+        '''Return the hit and miss counters of the cache.'''
+        return {'types': len(self._types),
+                'hits': self.hits,
+                'misses': self.misses}
@@ -0,0 +1,114 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Coalescing of the concurrent identical reads of the engine
+"""
+
+import sys
+import time
+
+from eventlet import event
+from repoze import lru
+
+from rushstack.openstack.common import log as logging
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight(object):
+    '''
+    Runs a single execution of the concurrent calls with the same key: the
+    first caller runs the function and the others wait for its result (or
+    exception). Up to size results are also kept for ttl seconds, so a
+    polling storm is answered from memory; a ttl of 0 only coalesces the
+    concurrent calls.
+
+    Keys are tuples whose second item is the tenant the result belongs
+    to, so the results of a tenant can be dropped when its rushes change.
+    '''
+
+    def __init__(self, ttl, size=1000):
+        self.ttl = ttl
+        # key: event of the running execution
+        self._inflight = {}
+        # key: (time its execution started, result)
+        self._results = lru.ExpiringLRUCache(size, default_timeout=ttl)
+        # tenant_id: time of its last invalidation, only for the tenants
+        # invalidated in the last ttl seconds (older results have expired)
+        self._invalidated = {}
+        self.executions = 0
+        self.shared = 0
+        self.cached = 0
+
+    def run(self, key, func, *args, **kwargs):
+        '''
+        Return func(*args, **kwargs), sharing the execution with the
+        concurrent calls of the same key
+        '''
+        if self.ttl:
+            #A result counts from the start of its execution, so the
+            #invalidations older than ttl can be forgotten
+            kept = self._results.get(key)
+            if (kept is not None and kept[0] > time.time() - self.ttl and
+                    kept[0] > self._invalidated.get(key[1], 0)):
+                self.cached += 1
+                return kept[1]
+
+        running = self._inflight.get(key)
+        if running is not None:
+            self.shared += 1
+            return running.wait()
+
+        running = event.Event()
+        self._inflight[key] = running
+        self.executions += 1
+        started = time.time()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            running.send_exception(*sys.exc_info())
+            raise
+        else:
+            if self.ttl:
+                self._results.put(key, (started, result))
+            running.send(result)
+            return result
+        finally:
+            del self._inflight[key]
+
+    def invalidate(self, tenant_id=None):
+        '''
+        Drop the kept results of the tenant, or all of them if tenant_id
+        is None
+        '''
+        if tenant_id is None:
+            self._results.clear()
+            self._invalidated.clear()
+            return
+        now = time.time()
+        for tenant, invalidated in self._invalidated.items():
+            if invalidated < now - self.ttl:
+                del self._invalidated[tenant]
+        self._invalidated[tenant_id] = now
+
+    def stats(self):
+        '''Return the coalescing counters.'''
+        calls = self.executions + self.shared + self.cached
+        return {'executions': self.executions,
+                'shared': self.shared,
+                'cached': self.cached,
+                'coalescing_factor': (float(calls) / self.executions
+                                      if self.executions else 0.0)}
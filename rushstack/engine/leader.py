@@ -0,0 +1,85 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Election of the engine running the cluster wide periodic jobs
+"""
+
+import time
+
+from oslo.config import cfg
+
+from rushstack.db import api as db_api
+from rushstack.openstack.common import log as logging
+
+logger = logging.getLogger(__name__)
+
+LEADER_LEASE = 'engine_leader'
+
+
+class LeaderElection(object):
+    '''
+    Leadership of the engines held as a lease in the engine_lease table.
+
+    Every engine calls renew() each third of engine_leader_lease: the
+    leader extends its lease and the others take it over once it has
+    expired, so a dead leader is replaced within engine_leader_lease
+    seconds. An engine that cannot reach the DB stops considering itself
+    the leader when its lease runs out.
+    '''
+
+    def __init__(self, owner):
+        self.owner = owner
+        self._expires = 0
+        self.elections = 0
+
+    @property
+    def is_leader(self):
+        return self._expires > time.time()
+
+    def renew(self, ctxt):
+        '''Take or extend the leadership lease if possible'''
+        was_leader = self.is_leader
+        start = time.time()
+        try:
+            held = db_api.engine_lease_acquire(ctxt, LEADER_LEASE, self.owner,
+                                               cfg.CONF.engine_leader_lease)
+        except Exception as e:
+            logger.exception('Leader lease renewal failed: %s' % e)
+            held = False
+            if was_leader and self.is_leader:
+                return
+        self._expires = start + cfg.CONF.engine_leader_lease if held else 0
+        if held and not was_leader:
+            self.elections += 1
+            logger.info('Engine %s is now the leader' % self.owner)
+        elif was_leader and not held:
+            logger.warning('Engine %s is no longer the leader' % self.owner)
+
+    def release(self, ctxt):
+        '''Give up the leadership, so another engine takes it at once'''
+        if not self.is_leader:
+            return
+        self._expires = 0
+        try:
+            db_api.engine_lease_release(ctxt, LEADER_LEASE, self.owner)
+        except Exception as e:
+            logger.warning('Leader lease release failed: %s' % e)
+
+    def stats(self):
+        '''Return the leadership state of this engine.'''
+        return {'owner': self.owner,
+                'leader': self.is_leader,
+                'elections': self.elections}
@@ -0,0 +1,175 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Warm pool of rush stacks provisioned in advance
+"""
+
+import datetime
+
+from heatclient import exc as heat_exc
+from oslo.config import cfg
+
+from rushstack.db import api as db_api
+from rushstack.openstack.common import log as logging
+from rushstack.openstack.common import timeutils
+from rushstack.openstack.common import uuidutils
+from rushstack.rpc import api as rpc_api
+
+logger = logging.getLogger(__name__)
+
+# Statuses of the pool stacks start_rush_stack can claim, best first
+CLAIMABLE_STATUSES = (rpc_api.STATUS_CREATE_COMPLETE,
+                      rpc_api.STATUS_CREATE_IN_PROGRESS)
+
+FAILED_STATUSES = (rpc_api.STATUS_CREATE_FAILED,
+                   rpc_api.STATUS_ROLLBACK_COMPLETE,
+                   rpc_api.STATUS_ROLLBACK_FAILED)
+
+
+class WarmPool(object):
+    '''
+    Stacks provisioned in advance for each rush type, tracked in the
+    rush_pool table. start_rush_stack claims one of them instead of
+    waiting for HEAT, and refill() provisions new ones to replace them.
+    '''
+
+    def __init__(self):
+        self.sizes = {}
+        for entry in cfg.CONF.rush_pool_sizes:
+            type_id, size = entry.split(':')
+            self.sizes[int(type_id)] = int(size)
+        self.hits = 0
+        self.misses = 0
+        self.provisioned = 0
+        self._refilling = False
+
+    def size(self, rush_type_id):
+        return self.sizes.get(rush_type_id, cfg.CONF.rush_pool_size)
+
+    def claim(self, ctxt, rush_type_id, rush_id):
+        '''
+        Assign a pool stack of the rush type to rush_id, preferring the
+        complete ones.
+
+        Returns: the claimed RushPool, or None if the pool is empty
+        '''
+        if not self.size(rush_type_id):
+            return None
+        for status in CLAIMABLE_STATUSES:
+            pooled = db_api.rush_pool_claim(ctxt, rush_type_id, rush_id, status)
+            if pooled is not None:
+                self.hits += 1
+                return pooled
+        self.misses += 1
+        return None
+
+    def refresh(self, ctxt, heatcln):
+        '''
+        Update the status of the unclaimed pool stacks with a single stack
+        list, drop the failed ones and those deleted out of band, and
+        release the stale claims.
+        '''
+        entries = db_api.rush_pool_get_all_unclaimed(ctxt)
+        if entries:
+            stacks = dict((stack._info['id'], stack._info)
+                          for stack in heatcln.stacks.list())
+        for entry in entries:
+            stack_info = stacks.get(entry.stack_id)
+            if stack_info is None:
+                #Not listed: confirm that it was deleted out of band
+                try:
+                    stack_info = heatcln.stacks.get(entry.stack_id)._info
+                except heat_exc.HTTPNotFound:
+                    logger.warning('Pool stack %s is gone from HEAT' %
+                                   entry.stack_id)
+                    db_api.rush_pool_delete(ctxt, entry.id)
+                    continue
+            status = stack_info['stack_status']
+            if status in FAILED_STATUSES:
+                logger.warning('Pool stack %s failed with status %s' %
+                               (entry.stack_id, status))
+                heatcln.stacks.delete(entry.stack_id)
+                db_api.rush_pool_delete(ctxt, entry.id)
+            elif status != entry.status:
+                db_api.rush_pool_update(ctxt, entry.id, {'status': status})
+        self._expire_claims(ctxt)
+
+    def _expire_claims(self, ctxt):
+        '''
+        A claim and the new rush are committed together, and the pool row
+        is deleted with them. A row claimed for longer than
+        rush_pool_refill_interval was left behind: delete it if its rush
+        got the stack, give it back to the pool otherwise.
+        '''
+        before = timeutils.utcnow() - datetime.timedelta(
+            seconds=cfg.CONF.rush_pool_refill_interval)
+        for entry in db_api.rush_pool_get_all_claimed(ctxt, before):
+            if db_api.rush_stack_get(ctxt, entry.rush_id) is not None:
+                db_api.rush_pool_delete(ctxt, entry.id)
+            else:
+                logger.warning('Releasing the stale claim of pool stack %s' %
+                               entry.stack_id)
+                db_api.rush_pool_update(ctxt, entry.id, {'rush_id': None})
+
+    def refill(self, ctxt, rush_types, create_stack):
+        '''
+        Provision the stacks missing in the pool of each rush type.
+
+        :param rush_types: dicts of the rush types (see RushTypeCache)
+        :param create_stack: function(stack_name, rush_type) creating a
+                             stack and returning its data (see
+                             EngineService.get_created_stack_info)
+        '''
+        if self._refilling:
+            return
+        self._refilling = True
+        try:
+            unclaimed = {}
+            for entry in db_api.rush_pool_get_all_unclaimed(ctxt):
+                unclaimed[entry.rush_type_id] = \
+                    unclaimed.get(entry.rush_type_id, 0) + 1
+
+            for rush_type in rush_types:
+                missing = self.size(rush_type['id']) - \
+                    unclaimed.get(rush_type['id'], 0)
+                for i in range(missing):
+                    self._provision(ctxt, rush_type, create_stack)
+        finally:
+            self._refilling = False
+
+    def _provision(self, ctxt, rush_type, create_stack):
+        pool_id = uuidutils.generate_uuid()
+        stack_name = '%sPOOL-%s-%s' % (cfg.CONF.tdaf_rush_prefix,
+                                       rush_type['id'], pool_id)
+        created = create_stack(stack_name, rush_type)
+        if created is None:
+            logger.error('Pool stack %s not found after creation' %
+                         stack_name)
+            return
+        values = {'id': pool_id,
+                  'rush_type_id': rush_type['id'],
+                  'stack_id': created['id'],
+                  'stack_name': stack_name,
+                  'status': created['stack_status'],
+                  'extdata': {'links': created.get('links', [])}}
+        db_api.rush_pool_create(ctxt, values)
+        self.provisioned += 1
+
+    def stats(self):
+        '''Return the hit and miss counters of the pool.'''
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'provisioned': self.provisioned}
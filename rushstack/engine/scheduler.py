@@ -0,0 +1,155 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Bounded concurrency scheduler for the HEAT operations of the engine
+"""
+
+import itertools
+import time
+
+from eventlet import event
+
+from rushstack.openstack.common import log as logging
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = (
+    PRIORITY_DELETE, PRIORITY_READ, PRIORITY_CREATE
+) = (
+    0, 1, 2
+)
+
+PRIORITY_NAMES = {
+    PRIORITY_DELETE: 'delete',
+    PRIORITY_READ: 'read',
+    PRIORITY_CREATE: 'create',
+}
+
+
+class Scheduler(object):
+    '''
+    Runs operations with at most max_concurrency of them at the same time,
+    and at most max_tenant_concurrency of them for the same tenant.
+    Operations waiting for a slot are started by priority (deletes, then
+    reads, then creates) and then in arrival order.
+    '''
+
+    def __init__(self, tg, max_concurrency, max_tenant_concurrency):
+        '''
+        :param tg: ThreadGroup used to spawn the background operations
+        :param max_concurrency: global limit of running operations
+        :param max_tenant_concurrency: limit of running operations per tenant
+        '''
+        self.tg = tg
+        self.max_concurrency = max_concurrency
+        self.max_tenant_concurrency = max_tenant_concurrency
+        self._running = 0
+        self._tenant_running = {}
+        # (priority, sequence, tenant_id, event) of the waiting operations
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._executed = dict((p, 0) for p in PRIORITIES)
+        self._queued = 0
+        self._max_queue_depth = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+
+    def _can_run(self, tenant_id):
+        return (self._running < self.max_concurrency and
+                self._tenant_running.get(tenant_id, 0) <
+                self.max_tenant_concurrency)
+
+    def _take(self, tenant_id):
+        self._running += 1
+        self._tenant_running[tenant_id] = \
+            self._tenant_running.get(tenant_id, 0) + 1
+
+    def _dispatch(self):
+        '''Wake up, in priority order, the waiters that can run now.'''
+        for waiter in sorted(self._waiting):
+            if self._running >= self.max_concurrency:
+                break
+            tenant_id = waiter[2]
+            if self._can_run(tenant_id):
+                self._waiting.remove(waiter)
+                self._take(tenant_id)
+                waiter[3].send()
+
+    def _acquire(self, tenant_id, priority):
+        if not self._waiting and self._can_run(tenant_id):
+            self._take(tenant_id)
+            return
+
+        start = time.time()
+        waiter = (priority, self._sequence.next(), tenant_id, event.Event())
+        self._waiting.append(waiter)
+        self._queued += 1
+        self._max_queue_depth = max(self._max_queue_depth,
+                                    len(self._waiting))
+        self._dispatch()
+        try:
+            waiter[3].wait()
+        except BaseException:
+            if waiter in self._waiting:
+                self._waiting.remove(waiter)
+            else:
+                self._release(tenant_id)
+            raise
+        waited = time.time() - start
+        self._wait_time_total += waited
+        self._wait_time_max = max(self._wait_time_max, waited)
+
+    def _release(self, tenant_id):
+        self._running -= 1
+        self._tenant_running[tenant_id] -= 1
+        if not self._tenant_running[tenant_id]:
+            del self._tenant_running[tenant_id]
+        self._dispatch()
+
+    def run(self, tenant_id, priority, func, *args, **kwargs):
+        '''
+        Run func(*args, **kwargs) in the calling green thread as soon as
+        there is a free slot for the tenant, and return its result.
+        '''
+        self._acquire(tenant_id, priority)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._executed[priority] += 1
+            self._release(tenant_id)
+
+    def spawn(self, tenant_id, priority, func, *args, **kwargs):
+        '''
+        Run func(*args, **kwargs) in a green thread of the thread group as
+        soon as there is a free slot for the tenant.
+        '''
+        self.tg.add_thread(self.run, tenant_id, priority, func,
+                           *args, **kwargs)
+
+    def stats(self):
+        '''Return the queue depth and wait time metrics of the scheduler.'''
+        executed = sum(self._executed.values())
+        return {
+            'running': self._running,
+            'queue_depth': len(self._waiting),
+            'max_queue_depth': self._max_queue_depth,
+            'queued': self._queued,
+            'executed': dict((PRIORITY_NAMES[p], n)
+                             for p, n in self._executed.iteritems()),
+            'wait_time_avg': (self._wait_time_total / self._queued
+                              if self._queued else 0.0),
+            'wait_time_max': self._wait_time_max,
+        }
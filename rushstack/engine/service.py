@@ -15,14 +15,26 @@
 
 import functools
 import json
+import os
+import time
 
+from eventlet import greenpool
+from heatclient import exc as heat_exc
 from oslo.config import cfg
+from repoze import lru
 import webob
 
 from rushstack.openstack.common import timeutils
 from rushstack.common import context
+from rushstack.common import exception as rushstack_exception
 from rushstack.db import api as db_api
 from rushstack.engine import api
+from rushstack.engine import cache
+from rushstack.engine import coalesce
+from rushstack.engine import leader
+from rushstack.engine import pool
+from rushstack.engine import scheduler
+from rushstack.engine import tasks
 from rushstack.rpc import api as rpc_api
 from rushstack.engine import clients
 
@@ -32,6 +44,7 @@ from rushstack.openstack.common.gettextutils import _
 from rushstack.openstack.common.rpc import service
 from rushstack.openstack.common import uuidutils
 from rushstack.openstack.common import exception
+from rushstack.heatapi import guard
 from rushstack.heatapi import heat
 
 import json
@@ -58,17 +71,68 @@ class EngineService(service.Service):
     are also dynamically added and will be named as keyword arguments
     by the RPC caller.
     """
+
+    RPC_API_VERSION = '1.2'
+
     def __init__(self, host, topic, manager=None):
         super(EngineService, self).__init__(host, topic)
+        # rush_id: (time of the next HEAT check, current check interval)
+        self._reconcile_schedule = {}
+        # Time of the next HEAT check of the settled rushes
+        self._next_settled_check = 0
+        self.scheduler = scheduler.Scheduler(self.tg,
+                                             cfg.CONF.heat_max_concurrency,
+                                             cfg.CONF.heat_max_concurrency_per_tenant)
+        cache_ttl = cfg.CONF.rush_cache_ttl
+        if cfg.CONF.engine_workers > 1:
+            #The other workers do not invalidate the cache of this one
+            cache_ttl = min(cache_ttl, cfg.CONF.rush_cache_shared_ttl)
+        self.rush_cache = cache.RushCache(cfg.CONF.rush_cache_size, cache_ttl)
+        self.rush_types = cache.RushTypeCache()
+        self.single_flight = coalesce.SingleFlight(cfg.CONF.rush_coalesce_ttl_ms / 1000.0,
+                                                   cfg.CONF.rush_cache_size)
+        self.rush_pool = pool.WarmPool()
+        self.engine_id = '%s.%s' % (host, os.getpid())
+        self.leader = leader.LeaderElection(self.engine_id)
+        self.tasks = tasks.TaskQueue(self.engine_id, self.scheduler, {
+            rpc_api.TASK_CREATE: (self._task_create, self._task_create_failed),
+            rpc_api.TASK_DELETE: (self._task_delete, self._task_delete_failed),
+        })
+        # stack_id: endpoint, for the complete stacks
+        self._endpoints = lru.LRUCache(cfg.CONF.rush_cache_size)
 
     def start(self):
+        # With engine_workers > 1 this runs in a forked worker, that must
+        # not share the DB connections and HEAT clients of its parent
+        db_api.reset()
+        heat.reset()
+        self.engine_id = '%s.%s' % (self.host, os.getpid())
+        self.leader.owner = self.engine_id
+        self.tasks.owner = self.engine_id
+
         super(EngineService, self).start()
 
+        try:
+            self.rush_types.load(context.get_admin_context())
+        except Exception as e:
+            logger.warning('Rush types could not be preloaded: %s' % e)
+
         # Create dummy service task, because when there is nothing queued
         # on self.tg the process exits
         logger.warning('periodic_interval:'+str(cfg.CONF.periodic_interval))
         self.tg.add_timer(cfg.CONF.periodic_interval,
                           self._service_task)
+        # Per node jobs run on every engine, the cluster wide ones
+        # (reconciler, warm pool) only on the leader
+        self.tg.add_timer(max(1, cfg.CONF.engine_leader_lease / 3),
+                          self._leader_task)
+        self.tg.add_timer(cfg.CONF.rush_reconcile_interval,
+                          self._reconcile_task)
+        self.tg.add_timer(cfg.CONF.rush_task_poll_interval,
+                          self._task_poll)
+        if cfg.CONF.rush_pool_size or cfg.CONF.rush_pool_sizes:
+            self.tg.add_timer(cfg.CONF.rush_pool_refill_interval,
+                              self._pool_task)
 
     def _service_task(self):
         """
@@ -78,7 +142,158 @@ class EngineService(service.Service):
         This could also be used to trigger periodic non-stack-specific
         housekeeping tasks
         """
-        pass
+        logger.debug('%s HEAT scheduler stats: %s' % (self.engine_id, self.scheduler.stats()))
+        try:
+            self.rush_types.refresh(context.get_admin_context())
+        except Exception as e:
+            logger.exception('Rush types refresh failed: %s' % e)
+        logger.debug('%s Rush cache stats: %s' % (self.engine_id, self.rush_cache.stats()))
+        logger.debug('%s Read coalescing stats: %s' % (self.engine_id, self.single_flight.stats()))
+        logger.debug('%s Rush type cache stats: %s' % (self.engine_id, self.rush_types.stats()))
+        logger.debug('%s Warm pool stats: %s' % (self.engine_id, self.rush_pool.stats()))
+        logger.debug('%s Task queue stats: %s' % (self.engine_id, self.tasks.stats()))
+        logger.debug('%s Leader election stats: %s' % (self.engine_id, self.leader.stats()))
+        logger.debug('%s Endpoint guard stats: %s' % (self.engine_id, guard.stats()))
+
+    def stop(self):
+        self.leader.release(context.get_admin_context())
+        super(EngineService, self).stop()
+
+    def _leader_task(self):
+        """
+        Periodic task that takes or keeps the leadership of the engines
+        """
+        self.leader.renew(context.get_admin_context())
+
+    def _task_poll(self):
+        """
+        Periodic task that runs the rush tasks waiting in the queue, and
+        those left behind by a dead engine
+        """
+        try:
+            self.tasks.poll(context.get_admin_context())
+        except Exception as e:
+            logger.exception('Rush task poll failed: %s' % e)
+
+    def _pool_task(self):
+        """
+        Periodic task that updates the status of the warm pool stacks and
+        provisions the ones missing for each rush type. Runs on the leader
+        engine only.
+        """
+        if not self.leader.is_leader:
+            return
+        try:
+            ctxt = context.get_admin_context()
+            self.scheduler.run(None, scheduler.PRIORITY_READ, self._refresh_pool, ctxt)
+            self.rush_pool.refill(ctxt, self.rush_types.get_all(), self._create_pool_stack)
+        except (rushstack_exception.EndpointUnavailable,
+                rushstack_exception.EndpointTimeout) as e:
+            logger.warning('Warm pool refill skipped: %s' % e)
+        except Exception as e:
+            logger.exception('Warm pool refill failed: %s' % e)
+
+    def _refresh_pool(self, ctxt):
+        with self._heat() as heatcln:
+            self.rush_pool.refresh(ctxt, heatcln)
+
+    def _create_pool_stack(self, stack_name, rush_type):
+        stack_info = self._build_stack_info(stack_name, rush_type)
+        return self.scheduler.run(None, scheduler.PRIORITY_CREATE, self._create_heat_stack, None, stack_info)
+
+    def _reconcile_task(self):
+        """
+        Periodic task that brings the DB status and endpoint of the rushes
+        in sync with HEAT, so that reads can be served from the DB.
+        All the unsettled rushes are checked with a single stack list. A
+        rush whose status does not change is checked less and less often,
+        up to rush_reconcile_interval_max. The settled rushes are checked
+        every rush_reconcile_interval_max too, as their stacks can still be
+        deleted or fail out of band. Runs on the leader engine only.
+        """
+        if not self.leader.is_leader:
+            return
+        try:
+            ctxt = context.get_admin_context()
+            rushes = db_api.rush_stack_get_all_unsettled(ctxt, rpc_api.RUSH_SETTLED_STATUSES)
+
+            now = time.time()
+            rush_ids = set(rush.id for rush in rushes)
+            schedule = dict((rush_id, entry) for rush_id, entry in self._reconcile_schedule.iteritems()
+                            if rush_id in rush_ids)
+            due = [rush for rush in rushes if schedule.get(rush.id, (0, 0))[0] <= now]
+            if now >= self._next_settled_check:
+                self._next_settled_check = now + cfg.CONF.rush_reconcile_interval_max
+                due.extend(rush for rush in db_api.rush_stack_get_all(ctxt) if rush.id not in rush_ids)
+            self._reconcile_schedule = schedule
+            if due:
+                self.scheduler.run(None, scheduler.PRIORITY_READ, self._reconcile_rushes, ctxt, due, schedule, now)
+        except (rushstack_exception.EndpointUnavailable,
+                rushstack_exception.EndpointTimeout) as e:
+            logger.warning('Rush status reconciliation skipped: %s' % e)
+        except Exception as e:
+            logger.exception('Rush status reconciliation failed: %s' % e)
+
+    def _reconcile_rushes(self, ctxt, rushes, schedule, now):
+        """
+        Update status and endpoint of the rushes with the HEAT data and
+        schedule their next check. All the changes are written with a
+        single bulk update.
+        """
+        deleted = []
+        updates = {}
+        deleting = set()
+        if any(rush.status == rpc_api.STATUS_DELETE_IN_PROGRESS for rush in rushes):
+            #Rushes stopped again after a DELETE_FAILED: HEAT reports the old
+            #failure until their new delete task runs
+            deleting = set(db_api.rush_task_get_rush_ids(ctxt, rpc_api.TASK_DELETE,
+                                                         (rpc_api.TASK_PENDING, rpc_api.TASK_RUNNING)))
+        with self._heat() as heatcln:
+            stacks = dict((stack._info['id'], stack._info) for stack in heatcln.stacks.list())
+            for rush in rushes:
+                changed = False
+                stack_info = stacks.get(rush.stack_id)
+                if rush.status == rpc_api.STATUS_DELETE_IN_PROGRESS:
+                    #HEAT does not list the deleted stacks
+                    if stack_info is None or stack_info['stack_status'] == rpc_api.STATUS_DELETE_COMPLETE:
+                        deleted.append(rush.id)
+                        schedule.pop(rush.id, None)
+                        continue
+                    #Until HEAT gets the delete the stack keeps its old status.
+                    #A failure of a queued delete is left to _task_delete_failed
+                    if stack_info['stack_status'] != rpc_api.STATUS_DELETE_FAILED or rush.id in deleting:
+                        stack_info = None
+                elif stack_info is None and rush.stack_id and rush.status != rpc_api.STATUS_DELETE_COMPLETE:
+                    #Not listed: confirm that it was deleted out of band
+                    stack_info = self._get_heat_stack(heatcln, rush.stack_id)
+                status = rush.status
+                if stack_info is not None and stack_info['stack_status'] != rush.status:
+                    status = stack_info['stack_status']
+                    updates.setdefault(rush.id, {})['status'] = status
+                    changed = True
+                if status == rpc_api.STATUS_CREATE_COMPLETE and rush.url is None:
+                    url = self.get_rush_endpoint(ctxt,heatcln,rush.stack_id,rush.rush_type_id)
+                    if url is not None:
+                        updates.setdefault(rush.id, {})['url'] = url
+
+                interval = schedule.get(rush.id, (0, 0))[1]
+                if changed or not interval:
+                    interval = cfg.CONF.rush_reconcile_interval
+                else:
+                    interval = min(interval * 2, cfg.CONF.rush_reconcile_interval_max)
+                schedule[rush.id] = (now + interval, interval)
+
+        changed = updates.keys() + deleted
+        #Read before the purge drops the rush_tenant rows
+        tenant_ids = db_api.rush_tenant_get_tenant_ids(ctxt, changed)
+        with ctxt.transaction():
+            db_api.rush_stack_update_many(ctxt, updates)
+            #The stacks are gone, forget the rushes
+            db_api.rush_stack_purge(ctxt, deleted)
+        for rush_id in changed:
+            self._invalidate(rush_id, tenant_ids.get(rush_id))
+        if deleted:
+            logger.info('Purged %d deleted rushes' % len(deleted))
 
     def echo(self,cnxt,msg):
         '''
@@ -87,43 +302,47 @@ class EngineService(service.Service):
         return '*%s*'%msg
 
     @request_context
-    def get_list(self, ctxt,tenant_id):
+    def get_list(self, ctxt,tenant_id, limit=None, marker=None, status=None, rush_type_id=None, fields=None):
         """
         Get Rush service list for the tenant (ctxt should contain tenant_id).
 
         :param ctxt: RPC context (must contain tenant_id)
         :param tenant_id: tenant_id to check for Rush
+        :param limit: maximum number of rushes to return
+        :param marker: id of the last rush of the previous page
+        :param status: status or list of statuses to filter by
+        :param rush_type_id: rush type to filter by
+        :param fields: list of fields to return for each rush (all by default)
         
-        Returns: JSON Specifying the list of rush services and their data
+        Returns: JSON Specifying the list of rush services and their data. When the page is full,
+                 next_marker is the marker to get the next one
         Response sample: {'result': True, 'rush_services': [{'id': '8483934393','name':'Rush prepro','type':1 ,'endpoint': 'http://10.1.1.1:5001', 'status': 'CREATE_COMPLETE' }]}
         """
-        
+        if isinstance(status, list):
+            status = tuple(status)
+        if isinstance(fields, list):
+            fields = tuple(fields)
+        key = ('get_list', tenant_id, limit, marker, status, rush_type_id, fields)
+        return self.single_flight.run(key, self._get_list, ctxt, tenant_id, limit, marker, status, rush_type_id, fields)
+
+    def _get_list(self, ctxt, tenant_id, limit, marker, status, rush_type_id, fields):
         try:
+            fields = fields or rpc_api.RUSH_LIST_FIELDS
+            unknown = [f for f in fields if f not in rpc_api.RUSH_LIST_FIELDS]
+            if unknown:
+                return {'result': False, 'error': 'GETLISTEX01', 'error_desc': 'Unknown fields: %s' % ','.join(unknown)}
+
             #Check in db if this tenant has an instanced Rush
-            rt = db_api.rush_tenant_get_all_by_tenant(ctxt, tenant_id)
+            #Status and endpoint are kept in sync with HEAT by _reconcile_task
+            rushes = self.rush_cache.get_list(ctxt, tenant_id, status=status, rush_type_id=rush_type_id,
+                                              limit=limit, marker=marker)
             result = {'result': True, 'rushes': []}
-            for rtentry in rt:
-                rush_entry = db_api.rush_stack_get(ctxt, rtentry.rush_id)
-                
-                #Update status with heat data (Rushstack DB can be out of sync with HEAT stack status)
-                #Can be removed to improve query performance when status is CREATE_COMPLETE
-                heatcln = heat.heatclient(cfg.CONF.tdaf_username, cfg.CONF.tdaf_user_password, cfg.CONF.tdaf_tenant_name)
-                
-                rush_stack_name = cfg.CONF.tdaf_rush_prefix+str(tenant_id)+"-"+str(rush_entry.name)
-                stack_list = self.get_stack_list_for_tenant(heatcln,tenant_id)
-                for stack in stack_list:
-                    stack_info = stack._info;
-                    if stack_info['stack_name'] == rush_stack_name:
-                        break
-                        
-                if stack_info is not None and stack_info['stack_name'] == rush_stack_name:
-                    #Stack info first
-                    values = {'status':stack_info['stack_status']}
-                    db_api.rush_stack_update(ctxt, rtentry.rush_id, values)
-                    
-                self.update_rush_endpointdata(ctxt,heatcln,rush_entry.stack_id,rtentry.rush_id)
-                result['rushes'].append({'id': rush_entry.id, 'name': rush_entry.name, 'type': rush_entry.rush_type_id,
-                                         'endpoint':rush_entry.url, 'status': rush_entry.status})
+            for rush_entry in rushes:
+                rush = {'id': rush_entry['id'], 'name': rush_entry['name'], 'type': rush_entry['rush_type_id'],
+                        'endpoint':rush_entry['url'], 'status': rush_entry['status']}
+                result['rushes'].append(dict((f, rush[f]) for f in fields))
+            if limit and len(rushes) == limit:
+                result['next_marker'] = rushes[-1]['id']
             return result
         except Exception as e:
             return {'result': False, 'error': str(e)}
@@ -142,7 +361,15 @@ class EngineService(service.Service):
                  to be ready for serving (check with get_status)
         Response sample: {'result': True, 'rush_id': '8483934393'}
         """
-        
+        return self._start_rush_stack(ctxt, tenant_id, rush_type_id, rush_name, cfg.CONF.rush_create_async)
+
+    def _start_rush_stack(self, ctxt, tenant_id, rush_type_id, rush_name, create_async):
+        """
+        Create new Rush service for the tenant (see start_rush_stack). The
+        HEAT stack is always created by a task. With create_async the rush
+        is returned as CREATE_PENDING, otherwise this engine runs the first
+        attempt of the task and answers when it is over.
+        """
         #Check in db if this tenant has an instanced Rush
         try:
             #Check that rush_name is not empty
@@ -150,55 +377,81 @@ class EngineService(service.Service):
                 return {'result': False, 'error': 'STARTRUSHEX01', 'error_desc': 'Rush name not provided'}
             
             #Check if type_id exists
-            rtc = db_api.rush_type_get(ctxt,rush_type_id)
+            rtc = self.rush_types.get(ctxt,rush_type_id)
             if not rtc:
                 return {'result': False, 'error': 'STARTRUSHEX02', 'error_desc': 'Rush type does not exist'}
                 
             rush_id = uuidutils.generate_uuid()
-            
-            #Call HEAT to create the stack
-            heatcln = heat.heatclient(cfg.CONF.tdaf_username, cfg.CONF.tdaf_user_password, cfg.CONF.tdaf_tenant_name)
-            
-            #Prapare dict for stack creation
-            stack_parms = {
-                'KeyName': cfg.CONF.tdaf_instance_key
-            }
-            
+
+            #Hand over a stack of the warm pool, if there is one ready.
+            #The claim and the new rush are committed together
+            with ctxt.transaction():
+                pooled = self.rush_pool.claim(ctxt, rtc['id'], rush_id)
+                if pooled is not None:
+                    values = {'stack_id':pooled.stack_id,'id':rush_id,'rush_type_id':rush_type_id,'status': pooled.status, 'name': rush_name,
+                              'extdata': dict(pooled.extdata or {})}
+                    db_api.rush_stack_create_for_tenant(ctxt, values, tenant_id)
+                    db_api.rush_pool_delete(ctxt, pooled.id)
+            if pooled is not None:
+                self._invalidate(rush_id, tenant_id)
+                self.tg.add_thread(self._pool_task)
+                return {'result': True, 'rush_id': rush_id}
+
             new_stack_name = cfg.CONF.tdaf_rush_prefix+str(tenant_id)+"-"+str(rush_name)
-            
-            stack_info = {
-                'stack_name': new_stack_name,
-                'parameters': stack_parms,
-                'template': rtc.template.replace ('\n', '\\n'),
-                'timeout_mins': 60,
-            }
-            heatcln.stacks.create(**stack_info)
-        
-            stack_list = self.get_stack_list_for_tenant(heatcln,tenant_id)
-            if len(stack_list) > 0:
-                #Check the name to select the one just created
-                for stack in stack_list:
-                    stack_info = stack._info;
-                    if stack_info['stack_name'] == new_stack_name:
-                        break
-
-                if stack_info is not None and stack_info['stack_name'] == new_stack_name:
-                    values = {'stack_id':stack_info['id'],'id':rush_id,'rush_type_id':rush_type_id,'status': stack_info['stack_status'], 'name': rush_name}
-                    rc = db_api.rush_stack_create(ctxt, values)
-                    values = {'rush_id':rush_id,'tenant_id':tenant_id}
-                    tc = db_api.rush_tenant_create(ctxt, values)
-                    return {'result': True, 'rush_id': rush_id, 'misc': str(stack_info)}
-                else:
-                    return {'result': False, 'error': 'STARTRUSHEX04', 'error_desc': 'OpenStack stack not found'}
-            else:
-                return {'result': False, 'error': 'STARTRUSHEX03', 'error_desc': 'OpenStack stack could not be created'}
+            stack_info = self._build_stack_info(new_stack_name, rtc)
+
+            #Record the rush with the task that will call HEAT, so that the
+            #stack is created even if this engine dies before it is done
+            values = {'stack_id':'','id':rush_id,'rush_type_id':rush_type_id,'status': rpc_api.STATUS_CREATE_PENDING, 'name': rush_name}
+            task = self.tasks.new_task(rpc_api.TASK_CREATE, rush_id, tenant_id, stack_info, claimed=not create_async)
+            db_api.rush_stack_create_for_tenant(ctxt, values, tenant_id, task)
+            self._invalidate(rush_id, tenant_id)
+            if create_async:
+                self.tg.add_thread(self._task_poll)
+                return {'result': True, 'rush_id': rush_id, 'status': rpc_api.STATUS_CREATE_PENDING}
+
+            #Run the first attempt here and answer with its result
+            succeeded = self.tasks.run_claimed(task)
+            ctxt.read_from_master = True
+            rsc = db_api.rush_stack_get(ctxt, rush_id)
+            if not succeeded:
+                return {'result': False, 'rush_id': rush_id, 'status': rsc.status,
+                        'error': 'STARTRUSHEX04', 'error_desc': 'OpenStack stack could not be created yet, it is retried in the background'}
+            return {'result': True, 'rush_id': rush_id, 'status': rsc.status}
         except Exception as e:
             return {'result': False, 'error': str(e)}
 
+    def _task_create(self, ctxt, task):
+        """
+        Create in HEAT the stack of a rush recorded as CREATE_PENDING by
+        start_rush_stack and store its stack id. A retry first looks for
+        the stack a previous attempt may have created.
+
+        :param task: CREATE task whose payload are the stack_info arguments
+        """
+        stack_info = task['payload']
+        created = None
+        if task['attempts'] > 1:
+            with self._heat() as heatcln:
+                created = self._find_heat_stack(heatcln, stack_info['stack_name'])
+        if created is None:
+            created = self._create_heat_stack(task['tenant_id'], stack_info)
+        if created is None:
+            raise rushstack_exception.StackNotFound(stack_name=stack_info['stack_name'])
+        values = {'stack_id': created['id'], 'status': created['stack_status'],
+                  'extdata': {'links': created.get('links', [])}}
+        self._update_rush(ctxt, task['rush_id'], values, task['tenant_id'])
+
+    def _task_create_failed(self, ctxt, task, error):
+        self._update_rush(ctxt, task['rush_id'], {'status': rpc_api.STATUS_CREATE_FAILED}, task['tenant_id'])
+
     @request_context
     def stop_rush_stack(self, ctxt,tenant_id,rush_id):
         """
-        Deletes the Rush service identified by rush_id for the tenant
+        Deletes the Rush service identified by rush_id for the tenant. The
+        rush is marked DELETE_IN_PROGRESS and the stack is deleted in the
+        background; the rush is forgotten once the reconciler sees the
+        stack gone from HEAT.
 
         :param ctxt: RPC context
         :param tenant_id: tenant_id to check for Rush
@@ -208,27 +461,117 @@ class EngineService(service.Service):
         Response sample: {'result': True, 'rush_id': '8483934393'}
         """
         
-        #Check in db if this tenant has an instanced Rush
+        #Check in db if this tenant has an instanced Rush. Read the master,
+        #a lagging replica could miss a delete already requested
+        ctxt.read_from_master = True
         rsc = db_api.rush_stack_get(ctxt,rush_id)
         if rsc:
             try:
                 #Check if it is for this tenant
                 rt = db_api.rush_tenant_get_by_rush_and_tenant(ctxt, rush_id, tenant_id)
-                if not rt or rt.first().tenant_id != tenant_id:
+                if rt is None:
                     return {'result': False, 'error': 'STOPRUSHEX02', 'error_desc': 'Could not find Rush for the tenant'}
-                    
-                #Call HEAT to destroy the stack
-                heatcln = heat.heatclient(cfg.CONF.tdaf_username, cfg.CONF.tdaf_user_password, cfg.CONF.tdaf_tenant_name)
-                heatcln.stacks.delete(rsc.stack_id)
-                
-                rt.delete()
-                rsc.delete()
+
+                if rsc.status == rpc_api.STATUS_DELETE_IN_PROGRESS:
+                    return {'result': True, 'rush_id': rush_id}
+                if not rsc.stack_id:
+                    return {'result': False, 'error': 'STOPRUSHEX03', 'error_desc': 'Rush stack is still being created, retry later'}
+
+                #Record the task that will call HEAT to destroy the stack
+                task = self.tasks.new_task(rpc_api.TASK_DELETE, rush_id, tenant_id, {'stack_id': rsc.stack_id})
+                db_api.rush_task_create(ctxt, task, {'status': rpc_api.STATUS_DELETE_IN_PROGRESS})
+                self._invalidate(rush_id, tenant_id)
+                self.tg.add_thread(self._task_poll)
                 return {'result': True, 'rush_id': rush_id}
             except Exception as e:
                 return {'result': False, 'error': str(e)}
         else:
             return {'result': False, 'error': 'STOPRUSHEX01', 'error_desc': 'Could not find Rush'}
 
+    def _update_rush(self, ctxt, rush_id, values, tenant_id=None):
+        """
+        Update the rush in the DB and drop its cached copies
+        """
+        db_api.rush_stack_update(ctxt, rush_id, values)
+        self._invalidate(rush_id, tenant_id)
+
+    def _invalidate(self, rush_id, tenant_id=None):
+        """
+        Drop the cached copies of the rush and the kept read results of
+        its tenant (of all the tenants if it is not known)
+        """
+        self.rush_cache.invalidate(rush_id, tenant_id)
+        self.single_flight.invalidate(tenant_id)
+
+    def _build_stack_info(self, stack_name, rush_type):
+        """
+        Arguments for the HEAT creation of a stack of the rush type
+        """
+        #Prapare dict for stack creation
+        stack_parms = {
+            'KeyName': cfg.CONF.tdaf_instance_key
+        }
+        return {
+            'stack_name': stack_name,
+            'parameters': stack_parms,
+            'template': rush_type['template'],
+            'timeout_mins': 60,
+        }
+
+    def _create_heat_stack(self, tenant_id, stack_info):
+        """
+        Create the stack in HEAT and return its data (see get_created_stack_info).
+        When the create request times out, HEAT may have created the stack
+        anyway: it is looked up by name before giving up.
+        """
+        with self._heat() as heatcln:
+            try:
+                create_result = heatcln.stacks.create(**stack_info)
+            except rushstack_exception.EndpointTimeout:
+                created = self._find_heat_stack(heatcln, stack_info['stack_name'])
+                if created is None:
+                    raise
+                logger.warning('Stack %s created although its create request timed out' % stack_info['stack_name'])
+                return created
+            return self.get_created_stack_info(heatcln,tenant_id,stack_info['stack_name'],create_result)
+
+    def _get_heat_stack(self, heatcln, stack_id):
+        """
+        Get the data of the stack, as DELETE_COMPLETE if HEAT does not have
+        it any more
+        """
+        try:
+            return heatcln.stacks.get(stack_id)._info
+        except heat_exc.HTTPNotFound:
+            return {'id': stack_id, 'stack_status': rpc_api.STATUS_DELETE_COMPLETE}
+
+    def _find_heat_stack(self, heatcln, stack_name):
+        """
+        Get the data of the stack named stack_name, or None if HEAT has none
+        """
+        for stack in heatcln.stacks.list(filters={'stack_name': stack_name}):
+            if stack._info['stack_name'] == stack_name:
+                return stack._info
+        return None
+
+    def _task_delete(self, ctxt, task):
+        """
+        Delete in HEAT the stack of a rush marked DELETE_IN_PROGRESS by
+        stop_rush_stack. The reconciler purges the rush once HEAT no
+        longer lists the stack.
+
+        :param task: DELETE task whose payload has the stack_id
+        """
+        try:
+            with self._heat() as heatcln:
+                heatcln.stacks.delete(task['payload']['stack_id'])
+        except heat_exc.HTTPNotFound:
+            #Already gone
+            pass
+
+    def _task_delete_failed(self, ctxt, task, error):
+        self._update_rush(ctxt, task['rush_id'], {'status': rpc_api.STATUS_DELETE_FAILED}, task['tenant_id'])
+
     @request_context
     def get_rush(self, ctxt,tenant_id,rush_id):
         """
@@ -241,27 +584,80 @@ class EngineService(service.Service):
         Returns: JSON Specifying the stop result and the rush_id.
         Response sample: {'result': True, 'rush_id': '8483934393', ''ws': 'http://10.95.158.11/rush'}
         """
-        
-        #Check in db if the rush exists
-        rsc = db_api.rush_stack_get(ctxt,rush_id)
-        if rsc:
+        return self.single_flight.run(('get_rush', tenant_id, rush_id), self._get_rush, ctxt, tenant_id, rush_id)
+
+    def _get_rush(self, ctxt, tenant_id, rush_id):
+        #Check in db (or the cache) if the rush exists for this tenant
+        rush = self.rush_cache.get_rush(ctxt, tenant_id, rush_id)
+        if rush:
             try:
-                #Check if it is for this tenant
-                rt = db_api.rush_tenant_get_all_by_tenant(ctxt, tenant_id)
-                if not rt or rt.first().tenant_id != tenant_id:
-                    return {'result': False, 'error': 'GETRUSHEX02', 'error_desc': 'Could not find Rush for the tenant'}
-                
                 #Check if the data is fill in. If not, update
-                if rsc.url is None:
-                    heatcln = heat.heatclient(cfg.CONF.tdaf_username, cfg.CONF.tdaf_user_password, cfg.CONF.tdaf_tenant_name)
-                    self.update_rush_endpointdata(ctxt,heatcln,rsc.stack_id,rush_id)
-                    
-                return {'result': True, 'rush_id': rush_id, 'url': str(rsc.url)}
+                if rush['url'] is None:
+                    self.scheduler.run(tenant_id, scheduler.PRIORITY_READ, self._update_rush_endpoint, ctxt, rush['stack_id'], rush_id, rush['rush_type_id'], tenant_id)
+                    rush = self.rush_cache.get_rush(ctxt, tenant_id, rush_id)
+
+                return {'result': True, 'rush_id': rush_id, 'url': str(rush['url'])}
+            except (rushstack_exception.EndpointUnavailable,
+                    rushstack_exception.EndpointTimeout) as e:
+                #HEAT is down or slow: answer with what the DB knows
+                return {'result': False, 'rush_id': rush_id, 'status': rush['status'],
+                        'error': 'GETRUSHEX03', 'error_desc': str(e)}
             except Exception as e:
                 return {'result': False, 'error': str(e)}
         else:
             return {'result': False, 'error': 'GETRUSHEX02', 'error_desc': 'Could not find Rush'}
     
+    def _heat(self):
+        """
+        Lend a pooled HEAT client for the TDAF service user. Use it as
+        a context manager: with self._heat() as heatcln: ...
+        """
+        return heat.client(cfg.CONF.tdaf_username, cfg.CONF.tdaf_user_password, cfg.CONF.tdaf_tenant_name)
+
+    @request_context
+    def batch_rush_operations(self, ctxt, tenant_id, operations):
+        """
+        Run several operations on the Rush services of the tenant, at most
+        rush_batch_concurrency of them at the same time. Creates always go
+        through the task queue, so the batch answers within the RPC timeout
+        with the CREATE_PENDING rush_ids
+
+        :param ctxt: RPC context
+        :param tenant_id: tenant_id owner of the Rushes
+        :param operations: list of dicts with the action ('create', 'delete'
+                           or 'get') and its arguments (rush_type_id and
+                           rush_name for create, rush_id for delete and get)
+
+        Returns: JSON with the result of each operation, in the same order
+        Response sample: {'result': True, 'results': [{'result': True, 'rush_id': '8483934393'}]}
+        """
+        if not isinstance(operations, list):
+            return {'result': False, 'error': 'BATCHRUSHEX01', 'error_desc': 'Operations must be a list'}
+        if len(operations) > cfg.CONF.rush_batch_max_size:
+            return {'result': False, 'error': 'BATCHRUSHEX02', 'error_desc': 'Too many operations in the batch'}
+
+        green_pool = greenpool.GreenPool(cfg.CONF.rush_batch_concurrency)
+        results = green_pool.imap(functools.partial(self._batch_operation, ctxt, tenant_id), operations)
+        return {'result': True, 'results': list(results)}
+
+    def _batch_operation(self, ctxt, tenant_id, operation):
+        """
+        Run one operation of a batch with its own copy of the context, so
+        concurrent operations do not share a DB session
+        """
+        try:
+            ctxt = context.RequestContext.from_dict(ctxt.to_dict())
+            action = operation.get('action')
+            if action == 'create':
+                return self._start_rush_stack(ctxt, tenant_id, operation.get('rush_type_id'), operation.get('rush_name'), True)
+            elif action == 'delete':
+                return self.stop_rush_stack(ctxt, tenant_id, operation.get('rush_id'))
+            elif action == 'get':
+                return self.get_rush(ctxt, tenant_id, operation.get('rush_id'))
+            return {'result': False, 'error': 'BATCHRUSHEX03', 'error_desc': 'Unknown action %s' % action}
+        except Exception as e:
+            return {'result': False, 'error': str(e)}
+
     def get_stack_list_for_tenant(self,heatcln,tenant_id):
         """
         Get all the stacks heat has configured for a tenant
@@ -284,6 +680,38 @@ class EngineService(service.Service):
             stack_list.append(stack)
         return stack_list
 
+    def get_stack_index_for_tenant(self,heatcln,tenant_id):
+        """
+        Get the data of all the stacks heat has configured for a tenant,
+        indexed by stack name, with a single stack list request
+
+        :param heatcln: HEAT client alread initialized
+        :param tenant_id: tenant_id to check
+
+        Returns: dict of stack_name: stack _info JSON (as defined by HEAT)
+        """
+        stack_list = self.get_stack_list_for_tenant(heatcln,tenant_id)
+        return dict((stack._info['stack_name'], stack._info) for stack in stack_list)
+
+    def get_created_stack_info(self,heatcln,tenant_id,stack_name,create_result):
+        """
+        Get the data of a stack just created, from the stacks.create response
+        body when it has it. Looking the stack up by name in the tenant
+        stack list is only a fallback for HEAT clients that do not return it
+
+        :param heatcln: HEAT client alread initialized
+        :param tenant_id: tenant_id the stack was created for
+        :param stack_name: name of the new stack
+        :param create_result: value returned by stacks.create
+
+        Returns: dict with the stack id, links and stack_status, or None if not found
+        """
+        if isinstance(create_result, dict) and 'stack' in create_result:
+            created = dict(create_result['stack'])
+            created.setdefault('stack_status', rpc_api.STATUS_CREATE_IN_PROGRESS)
+            return created
+        return self.get_stack_index_for_tenant(heatcln,tenant_id).get(stack_name)
+
     def get_instance_and_ip_list_for_stack_id(self,heatcln,stack_id):
         """
         Get all the instance resources and ip resources configured for a stack_id
@@ -309,7 +737,55 @@ class EngineService(service.Service):
                 ip_list.append(resource)
         return instance_list,ip_list
     
-    def update_rush_endpointdata(self,ctxt,heatcln,stack_id,rush_id):
+    def _update_rush_endpoint(self,ctxt,stack_id,rush_id,rush_type_id=None,tenant_id=None):
+        """
+        Updates in the DB the RUSH data based on the stack data, with a
+        pooled HEAT client
+        """
+        with self._heat() as heatcln:
+            self.update_rush_endpointdata(ctxt,heatcln,stack_id,rush_id,rush_type_id,tenant_id)
+
+    def get_rush_endpoint(self,ctxt,heatcln,stack_id,rush_type_id=None):
+        """
+        Get the endpoint of a rush stack. When the template of the rush type
+        declares the rush_endpoint_output output, it is read with a single
+        stacks.get. Otherwise the stack resources are scanned for an ip.
+        The endpoint of a complete stack is cached by stack id.
+
+        :param ctxt: RPC context
+        :param heatcln: HEAT client alread initialized
+        :param stack_id: stack_id to get the endpoint of
+        :param rush_type_id: rush type of the stack, if known
+
+        Returns: the endpoint url, or None if it is not available yet
+        """
+        url = self._endpoints.get(stack_id)
+        if url is not None:
+            return url
+
+        rush_type = self.rush_types.get(ctxt, rush_type_id) if rush_type_id is not None else None
+        template = (rush_type and rush_type['parsed_template']) or {}
+        outputs = template.get('Outputs') or template.get('outputs') or {}
+
+        if cfg.CONF.rush_endpoint_output in outputs:
+            stack_info = heatcln.stacks.get(stack_id)._info
+            complete = stack_info['stack_status'] == rpc_api.STATUS_CREATE_COMPLETE
+            for output in stack_info.get('outputs') or []:
+                if output['output_key'] == cfg.CONF.rush_endpoint_output:
+                    url = output['output_value']
+        else:
+            #Legacy templates: use the first ip as rush WS
+            instance_list,ip_list = self.get_instance_and_ip_list_for_stack_id(heatcln,stack_id)
+            if len(ip_list)>0:
+                ip_info = ip_list[0]._info;
+                url = 'http://'+ip_info['physical_resource_id']+':5001'
+            complete = url is not None
+
+        if url is not None and complete:
+            self._endpoints.put(stack_id, url)
+        return url
+
+    def update_rush_endpointdata(self,ctxt,heatcln,stack_id,rush_id,rush_type_id=None,tenant_id=None):
         """
         Updates in the DB the RUSH data based on the stack data
 
@@ -317,13 +793,11 @@ class EngineService(service.Service):
         :param heatcln: HEAT client alread initialized
         :param stack_id: stack_id to get all the resources from
         :param rush_id: rush_id to be updated with the obtained info
+        :param rush_type_id: rush type of the rush, if known
+        :param tenant_id: tenant owning the rush, if known
         """
-        #Get the instance list for this stack
-        instance_list,ip_list = self.get_instance_and_ip_list_for_stack_id(heatcln,stack_id)
-        
-        #If there is any ip, use it as rush WS
-        if len(ip_list)>0:
-            ip_info = ip_list[0]._info;
-            values = {'url':'http://'+ip_info['physical_resource_id']+':5001'}
-            db_api.rush_stack_update(ctxt, rush_id, values)
+        url = self.get_rush_endpoint(ctxt,heatcln,stack_id,rush_type_id)
+        if url is not None:
+            values = {'url':url}
+            self._update_rush(ctxt, rush_id, values, tenant_id)
             
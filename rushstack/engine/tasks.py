@@ -0,0 +1,205 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Durable queue of the rush lifecycle operations
+"""
+
+import datetime
+import json
+
+from oslo.config import cfg
+
+from rushstack.common import context
+from rushstack.db import api as db_api
+from rushstack.engine import scheduler
+from rushstack.openstack.common import log as logging
+from rushstack.openstack.common import timeutils
+from rushstack.openstack.common import uuidutils
+from rushstack.rpc import api as rpc_api
+
+logger = logging.getLogger(__name__)
+
+TASK_PRIORITIES = {
+    rpc_api.TASK_CREATE: scheduler.PRIORITY_CREATE,
+    rpc_api.TASK_DELETE: scheduler.PRIORITY_DELETE,
+}
+
+
+def task_to_dict(task):
+    '''
+    Detached copy of a RushTask row with its payload decoded
+    '''
+    return {'id': task.id,
+            'action': task.action,
+            'rush_id': task.rush_id,
+            'tenant_id': task.tenant_id,
+            'payload': json.loads(task.payload) if task.payload else {},
+            'attempts': task.attempts,
+            'max_attempts': task.max_attempts}
+
+
+class TaskQueue(object):
+    '''
+    Rush lifecycle operations kept in the rush_task table, so that any
+    engine can carry them on after a crash of the one that started them.
+
+    poll() leases runnable tasks to this engine for rush_task_lease
+    seconds and runs them through the scheduler. A task that fails is
+    retried with an exponential delay until max_attempts, then it is left
+    FAILED and the fail handler of its action is called. A task whose
+    lease expires (its engine died) is claimed again by any engine, so
+    the handlers must be idempotent.
+    '''
+
+    def __init__(self, owner, scheduler, handlers):
+        '''
+        :param owner: lease owner name of this engine
+        :param scheduler: Scheduler running the tasks
+        :param handlers: action: (run, fail) functions, called with
+                         (ctxt, task) and (ctxt, task, error)
+        '''
+        self.owner = owner
+        self.scheduler = scheduler
+        self.handlers = handlers
+        self._active = 0
+        self._polling = False
+        self.claimed = 0
+        self.succeeded = 0
+        self.retried = 0
+        self.failed = 0
+
+    def new_task(self, action, rush_id, tenant_id, payload, claimed=False):
+        '''
+        Return the values of a new PENDING task, to be stored with
+        db_api.rush_task_create or db_api.rush_stack_create_for_tenant.
+        With claimed the task is RUNNING, already leased to this engine
+        for its first attempt, so it can be run with run_claimed().
+        '''
+        values = {'id': uuidutils.generate_uuid(),
+                  'action': action,
+                  'rush_id': rush_id,
+                  'tenant_id': tenant_id,
+                  'payload': json.dumps(payload),
+                  'state': rpc_api.TASK_PENDING,
+                  'attempts': 0,
+                  'max_attempts': cfg.CONF.rush_task_max_attempts}
+        if claimed:
+            values.update({'state': rpc_api.TASK_RUNNING,
+                           'lease_owner': self.owner,
+                           'lease_expires_at': self._lease(
+                               cfg.CONF.rush_task_lease),
+                           'attempts': 1})
+        return values
+
+    def run_claimed(self, task):
+        '''
+        Run through the scheduler, and wait for, the first attempt of a
+        task stored as returned by new_task(..., claimed=True). Should this
+        engine die meanwhile, another one claims the task once its lease
+        expires. A failed attempt is retried by poll() like any other.
+
+        Returns: True if the task succeeded
+        '''
+        task = dict(task, payload=json.loads(task['payload']))
+        self.claimed += 1
+        return self.scheduler.run(task['tenant_id'],
+                                  TASK_PRIORITIES[task['action']],
+                                  self._run_active, task)
+
+    def _run_active(self, task):
+        self._active += 1
+        return self._run(task)
+
+    def poll(self, ctxt):
+        '''Claim as many runnable tasks as there are free slots and run them'''
+        if self._polling:
+            return
+        self._polling = True
+        try:
+            free = cfg.CONF.rush_task_concurrency - self._active
+            if free <= 0:
+                return
+            tasks = db_api.rush_task_claim(ctxt, self.owner,
+                                           cfg.CONF.rush_task_lease, free,
+                                           (rpc_api.TASK_PENDING,
+                                            rpc_api.TASK_RUNNING),
+                                           rpc_api.TASK_RUNNING)
+            for task in [task_to_dict(task) for task in tasks]:
+                self._active += 1
+                self.claimed += 1
+                try:
+                    self.scheduler.spawn(task['tenant_id'],
+                                         TASK_PRIORITIES[task['action']],
+                                         self._run, task)
+                except Exception:
+                    self._active -= 1
+                    raise
+        finally:
+            self._polling = False
+
+    def _lease(self, seconds):
+        return timeutils.utcnow() + datetime.timedelta(seconds=seconds)
+
+    def _run(self, task):
+        ctxt = context.get_admin_context()
+        try:
+            #The wait for a scheduler slot counts against the lease
+            if not db_api.rush_task_update(ctxt, task['id'], self.owner,
+                                           {'lease_expires_at': self._lease(
+                                               cfg.CONF.rush_task_lease)}):
+                logger.warning('Lease of task %s lost' % task['id'])
+                return False
+            run, fail = self.handlers[task['action']]
+            try:
+                run(ctxt, task)
+            except Exception as e:
+                logger.exception('Task %s %s of rush %s failed (attempt %d): '
+                                 '%s' % (task['id'], task['action'],
+                                         task['rush_id'], task['attempts'], e))
+                self._failed(ctxt, task, fail, e)
+                return False
+            db_api.rush_task_delete(ctxt, task['id'], self.owner)
+            self.succeeded += 1
+            return True
+        finally:
+            self._active -= 1
+
+    def _failed(self, ctxt, task, fail, error):
+        if task['attempts'] < task['max_attempts']:
+            delay = min(cfg.CONF.rush_task_retry_delay *
+                        2 ** (task['attempts'] - 1),
+                        cfg.CONF.rush_task_lease)
+            db_api.rush_task_update(ctxt, task['id'], self.owner,
+                                    {'state': rpc_api.TASK_PENDING,
+                                     'last_error': str(error),
+                                     'lease_expires_at': self._lease(delay)})
+            self.retried += 1
+            return
+
+        if db_api.rush_task_update(ctxt, task['id'], self.owner,
+                                   {'state': rpc_api.TASK_FAILED,
+                                    'last_error': str(error),
+                                    'lease_expires_at': None}):
+            self.failed += 1
+            fail(ctxt, task, error)
+
+    def stats(self):
+        '''Return the task counters of this engine.'''
+        return {'active': self._active,
+                'claimed': self.claimed,
+                'succeeded': self.succeeded,
+                'retried': self.retried,
+                'failed': self.failed}
@@ -0,0 +1,242 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Latency tracking, adaptive timeouts and circuit breaking for the remote
+endpoints (Keystone, HEAT) the engine depends on
+"""
+
+import collections
+import functools
+import inspect
+import logging
+import time
+
+import eventlet
+from oslo.config import cfg
+
+from rushstack.common import exception
+
+LOG = logging.getLogger(__name__)
+
+STATES = (
+    CLOSED, OPEN, HALF_OPEN
+) = (
+    'closed', 'open', 'half_open'
+)
+
+# Guards shared by the whole process, keyed by endpoint name
+_GUARDS = {}
+
+
+def get_guard(endpoint):
+    """Return the process wide guard of the endpoint"""
+    guard = _GUARDS.get(endpoint)
+    if guard is None:
+        guard = _GUARDS.setdefault(endpoint, EndpointGuard(endpoint))
+    return guard
+
+
+def reset():
+    """Forget the guards, e.g. in a forked process"""
+    _GUARDS.clear()
+
+
+def stats():
+    """Return the metrics of every guard, keyed by endpoint name"""
+    return dict((endpoint, guard.stats())
+                for endpoint, guard in _GUARDS.iteritems())
+
+
+def _is_failure(error):
+    """Client errors (HTTP 4xx) mean the endpoint itself is healthy"""
+    code = getattr(error, 'code', None)
+    return not (isinstance(code, int) and 400 <= code < 500)
+
+
+class EndpointGuard(object):
+    """
+    Runs the calls to one endpoint with a timeout derived from the p99 of
+    the recent latencies of the same operation, and opens a circuit
+    breaker after endpoint_breaker_failures consecutive failures. While
+    the breaker is open calls fail fast with EndpointUnavailable; after
+    endpoint_breaker_reset seconds a single probe call is let through and
+    its result closes or reopens the breaker.
+
+    Operations are named '<manager>.<method>', e.g. 'stacks.list'. The
+    methods in WRITE_OPERATIONS are not idempotent: timing one out
+    early can leave its effect behind (e.g. a created stack) unknown to
+    the caller, so they only get the endpoint_write_timeout ceiling.
+    """
+
+    WRITE_OPERATIONS = ('create', 'delete', 'update')
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.calls = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._probing = False
+        # operation: latencies of its recent calls
+        self._latencies = {}
+
+    def _percentile(self, operation, percent):
+        latencies = self._latencies.get(operation)
+        if not latencies:
+            return None
+        latencies = sorted(latencies)
+        return latencies[int(round(percent * (len(latencies) - 1)))]
+
+    def timeout(self, operation=None):
+        """Current timeout of the operation calls, in seconds"""
+        if operation and operation.split('.')[-1] in self.WRITE_OPERATIONS:
+            return cfg.CONF.endpoint_write_timeout
+        p99 = self._percentile(operation, 0.99)
+        if p99 is None or len(self._latencies[operation]) < 10:
+            return cfg.CONF.endpoint_timeout_max
+        return min(max(p99 * cfg.CONF.endpoint_timeout_multiplier,
+                       cfg.CONF.endpoint_timeout_min),
+                   cfg.CONF.endpoint_timeout_max)
+
+    def _allow(self):
+        """
+        Return whether a call may go through now, and whether it took the
+        slot of the half-open probe
+        """
+        if self.state == OPEN:
+            if time.time() - self.opened_at < cfg.CONF.endpoint_breaker_reset:
+                return False, False
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self._probing:
+                return False, False
+            self._probing = True
+            return True, True
+        return True, False
+
+    def _success(self, operation, latency):
+        latencies = self._latencies.get(operation)
+        if latencies is None:
+            latencies = self._latencies[operation] = collections.deque(
+                maxlen=cfg.CONF.endpoint_latency_window)
+        latencies.append(latency)
+        self.failures = 0
+        if self.state != CLOSED:
+            LOG.info('Circuit breaker of %s closed' % self.endpoint)
+        self.state = CLOSED
+
+    def _failure(self):
+        self.failures += 1
+        if (self.state == HALF_OPEN or
+                self.failures >= cfg.CONF.endpoint_breaker_failures):
+            if self.state != OPEN:
+                LOG.warning('Circuit breaker of %s opened after %d failures'
+                            % (self.endpoint, self.failures))
+            self.state = OPEN
+            self.opened_at = time.time()
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call func(*args, **kwargs) guarded by the breaker and the adaptive
+        timeout of the calls without operation name (see call_operation)
+        """
+        return self.call_operation(None, func, *args, **kwargs)
+
+    def call_operation(self, operation, func, *args, **kwargs):
+        """
+        Call func(*args, **kwargs) guarded by the breaker and the timeout
+        of the operation. Generators are consumed inside the guard and
+        returned as lists, so the timeout covers all the requests they
+        make.
+        """
+        allowed, probe = self._allow()
+        if not allowed:
+            self.rejected += 1
+            raise exception.EndpointUnavailable(endpoint=self.endpoint)
+
+        self.calls += 1
+        timeout = self.timeout(operation)
+        start = time.time()
+        try:
+            with eventlet.Timeout(timeout):
+                result = func(*args, **kwargs)
+                if inspect.isgenerator(result):
+                    result = list(result)
+        except eventlet.Timeout:
+            self.timeouts += 1
+            self._failure()
+            raise exception.EndpointTimeout(endpoint=self.endpoint,
+                                            timeout=timeout)
+        except Exception as e:
+            if _is_failure(e):
+                self._failure()
+            else:
+                self._success(operation, time.time() - start)
+            raise
+        else:
+            self._success(operation, time.time() - start)
+            return result
+        finally:
+            if probe:
+                self._probing = False
+
+    def stats(self):
+        """Return the state and per operation latency metrics of the guard"""
+        return {'state': self.state,
+                'failures': self.failures,
+                'calls': self.calls,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'operations': dict(
+                    (operation, {'timeout': self.timeout(operation),
+                                 'latency_p50': self._percentile(operation,
+                                                                 0.5),
+                                 'latency_p99': self._percentile(operation,
+                                                                 0.99)})
+                    for operation in self._latencies)}
+
+
+class _GuardedManager(object):
+    """HEAT client manager (stacks, resources...) calling through a guard"""
+
+    def __init__(self, name, manager, guard):
+        self._name = name
+        self._manager = manager
+        self._guard = guard
+
+    def __getattr__(self, name):
+        attr = getattr(self._manager, name)
+        if callable(attr):
+            return functools.partial(self._guard.call_operation,
+                                     '%s.%s' % (self._name, name), attr)
+        return attr
+
+
+class GuardedClient(object):
+    """HEAT client whose manager calls go through the endpoint guard"""
+
+    MANAGERS = ('stacks', 'resources', 'events')
+
+    def __init__(self, client, guard):
+        self._client = client
+        self._guard = guard
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name in self.MANAGERS:
+            return _GuardedManager(name, attr, self._guard)
+        return attr
@@ -12,14 +12,26 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import contextlib
 import logging
 
+from eventlet import pools
+from eventlet import semaphore
 from heatclient import client as heat_client
+from heatclient import exc as heat_exc
 from oslo.config import cfg
 from keystoneclient.v2_0 import client as ksclient
 
+from rushstack.heatapi import guard
+
 LOG = logging.getLogger(__name__)
 
+API_VERSION = "1"
+
+# Client pools shared by the whole process, keyed by
+# (username, tenant_name, auth_url)
+_POOLS = {}
+
 
 def format_parameters(params):
     parameters = {}
@@ -44,28 +56,134 @@ def _get_ksclient(**kwargs):
                            auth_url=kwargs.get('auth_url'),
                            insecure=kwargs.get('insecure'))
 
-def heatclient(username=None,password=None,tenant_name=None):
-    api_version = "1"
-    insecure = False
-    kwargs = {
-        'username': username,
-        'password': password,
-        'tenant_id': None,
-        'tenant_name': tenant_name,
-        'auth_url': cfg.CONF.auth_uri,
-        #'service_type': args.os_service_type,
-        #'endpoint_type': cfg.CONF.orchestration_type,
-        'insecure': insecure
-    }
-    ksclient = _get_ksclient(**kwargs)
-    kwargs['token'] = ksclient.auth_token
-
-    #Get the endpoint
-    endpoint = ksclient.service_catalog.get_endpoints(cfg.CONF.orchestration_type)[cfg.CONF.orchestration_type][0]['publicURL']
-    
-    client = heat_client.Client(api_version, endpoint, **kwargs)
-    client.format_parameters = format_parameters
-    return client
+
+class HeatClientPool(pools.Pool):
+    """
+    Bounded pool of Heat clients for one set of credentials.
+
+    All the clients share a single Keystone token and orchestration
+    endpoint. The token is reused until it is about to expire
+    (heat_token_stale_duration) and it is renewed in authenticate() only,
+    so concurrent green threads never authenticate more than once.
+    """
+
+    def __init__(self, username, password, tenant_name, auth_url):
+        super(HeatClientPool, self).__init__(
+            max_size=cfg.CONF.heat_client_pool_size)
+        self.credentials = {
+            'username': username,
+            'password': password,
+            'tenant_id': None,
+            'tenant_name': tenant_name,
+            'auth_url': auth_url,
+            'insecure': False
+        }
+        self.token = None
+        self.endpoint = None
+        self._auth_ref = None
+        self._auth_lock = semaphore.Semaphore()
+
+    def _token_is_valid(self):
+        return (self._auth_ref is not None and
+                not self._auth_ref.will_expire_soon(
+                    cfg.CONF.heat_token_stale_duration))
+
+    def authenticate(self):
+        """
+        Get a new token and orchestration endpoint from Keystone, unless
+        the current token is still valid.
+        """
+        if self._token_is_valid():
+            return
+        with self._auth_lock:
+            #Another green thread may have renewed it while we waited
+            if self._token_is_valid():
+                return
+            LOG.debug('Authenticating %s on %s for the heat client pool' %
+                      (self.credentials['username'],
+                       self.credentials['auth_url']))
+            keystone = guard.get_guard('keystone:%s' % self.credentials[
+                'auth_url']).call(_get_ksclient, **self.credentials)
+            endpoints = keystone.service_catalog.get_endpoints(
+                cfg.CONF.orchestration_type)
+            self.endpoint = endpoints[cfg.CONF.orchestration_type][0]['publicURL']
+            self.token = keystone.auth_token
+            self._auth_ref = keystone.auth_ref
+
+    def invalidate(self):
+        """Force a new authentication on the next request."""
+        self._auth_ref = None
+
+    def create(self):
+        kwargs = dict(self.credentials, token=self.token)
+        client = heat_client.Client(API_VERSION, self.endpoint, **kwargs)
+        client.format_parameters = format_parameters
+        client.rushstack_token = self.token
+        return guard.GuardedClient(client,
+                                   guard.get_guard('heat:%s' % self.endpoint))
+
+    @contextlib.contextmanager
+    def item(self):
+        """
+        Check a client out of the pool, waiting for a free one when all
+        heat_client_pool_size clients are in use. The calls of its stacks,
+        resources and events managers go through the guard of the endpoint
+        (see rushstack.heatapi.guard).
+        """
+        self.authenticate()
+        client = self.get()
+        try:
+            if client.rushstack_token != self.token:
+                #The token was renewed since this client was built
+                client = self.create()
+            yield client
+        except heat_exc.HTTPUnauthorized:
+            self.invalidate()
+            raise
+        finally:
+            self.put(client)
+
+
+def get_pool(username=None, password=None, tenant_name=None):
+    """
+    Return the process wide client pool for these credentials
+    """
+    key = (username, tenant_name, cfg.CONF.auth_uri)
+    pool = _POOLS.get(key)
+    if pool is None or pool.credentials['password'] != password:
+        pool = HeatClientPool(username, password, tenant_name,
+                              cfg.CONF.auth_uri)
+        _POOLS[key] = pool
+    return pool
+
+
+def reset():
+    """
+    Forget the client pools and endpoint guards. A forked process must call
+    it so it does not share the connections of its parent.
+    """
+    _POOLS.clear()
+    guard.reset()
+
+
+def client(username=None, password=None, tenant_name=None):
+    """
+    Context manager that lends a pooled, already authenticated Heat client
+
+        with heat.client(username, password, tenant_name) as heatcln:
+            heatcln.stacks.list()
+    """
+    return get_pool(username, password, tenant_name).item()
+
+
+def heatclient(username=None, password=None, tenant_name=None):
+    """
+    Return a new Heat client that reuses the cached Keystone token of the
+    pool for these credentials. Prefer client() to get a pooled one.
+    """
+    pool = get_pool(username, password, tenant_name)
+    pool.authenticate()
+    return pool.create()
 
 def stacks_list(request):
     return heatclient(request).stacks.list()
@@ -62,7 +62,20 @@ db_opts = [
                'database'),
     cfg.IntOpt('sql_idle_timeout',
                default=3600,
-               help='timeout before idle sql connections are reaped')]
+               help='timeout before idle sql connections are reaped'),
+    cfg.ListOpt('sql_read_connection',
+                default=[],
+                help='SQLAlchemy connection strings of read replicas the '
+                     'read only queries are spread over. Writes always go '
+                     'to sql_connection'),
+    cfg.IntOpt('sql_read_after_write_window',
+               default=5,
+               help='Seconds after a write of this process during which '
+                    'the reads go to sql_connection, so they do not miss '
+                    'it on a lagging replica. Writes of other processes '
+                    'are not covered: a rush missing on the replica is '
+                    'looked up again on sql_connection, but a rush list '
+                    'may lag behind them by the replication delay')]
 
 engine_opts = [
     cfg.StrOpt('auth_uri',
@@ -86,6 +99,136 @@ engine_opts = [
     cfg.StrOpt('tdaf_instance_key',
                 default='TDAF',
                 help='SSH public key to use when creating the instances'),
+    cfg.IntOpt('heat_client_pool_size',
+               default=10,
+               help='Maximum number of HEAT clients kept per set of '
+                    'credentials'),
+    cfg.BoolOpt('rush_create_async',
+                default=False,
+                help='Return from start_rush_stack as soon as the rush is '
+                     'recorded with the task that creates its HEAT stack. '
+                     'Otherwise the engine runs the first attempt of the '
+                     'task and answers when it is over'),
+    cfg.IntOpt('engine_workers',
+               default=1,
+               help='Number of engine processes to fork, all consuming from '
+                    'the engine topic'),
+    cfg.IntOpt('engine_leader_lease',
+               default=15,
+               help='Seconds the leader engine, the one running the cluster '
+                    'wide periodic jobs, holds its lease. A dead leader is '
+                    'replaced within this time'),
+    cfg.IntOpt('rush_task_poll_interval',
+               default=2,
+               help='Seconds between two polls of the rush task queue'),
+    cfg.IntOpt('rush_task_lease',
+               default=300,
+               help='Seconds an engine holds a rush task before any other '
+                    'engine may take it over'),
+    cfg.IntOpt('rush_task_concurrency',
+               default=20,
+               help='Maximum number of rush tasks an engine runs at the '
+                    'same time'),
+    cfg.IntOpt('rush_task_max_attempts',
+               default=5,
+               help='Number of times a rush task is tried before it is '
+                    'given up'),
+    cfg.IntOpt('rush_task_retry_delay',
+               default=10,
+               help='Seconds before the first retry of a failed rush task, '
+                    'doubled on each further retry'),
+    cfg.IntOpt('rush_reconcile_interval',
+               default=10,
+               help='Seconds between checks of the HEAT status of the '
+                    'rushes that are not settled yet'),
+    cfg.IntOpt('rush_reconcile_interval_max',
+               default=120,
+               help='Maximum seconds between HEAT checks of a rush whose '
+                    'status does not change, and seconds between HEAT '
+                    'checks of the settled rushes'),
+    cfg.IntOpt('rush_cache_size',
+               default=1000,
+               help='Maximum number of rushes and tenant rush lists kept '
+                    'in the engine cache, and of read results kept for '
+                    'rush_coalesce_ttl_ms'),
+    cfg.IntOpt('rush_cache_ttl',
+               default=30,
+               help='Seconds a rush stays in the engine cache. An engine '
+                    'process only drops the cached copies of the rushes it '
+                    'changes itself: the changes made through the other '
+                    'processes are seen within this time'),
+    cfg.IntOpt('rush_cache_shared_ttl',
+               default=2,
+               help='Upper bound of rush_cache_ttl when engine_workers > 1, '
+                    'so a rush created or deleted through a worker shows '
+                    'up in the lists of the others within this time'),
+    cfg.IntOpt('rush_pool_size',
+               default=0,
+               help='Number of stacks kept provisioned in advance for each '
+                    'rush type (0 disables the warm pool)'),
+    cfg.ListOpt('rush_pool_sizes',
+                default=[],
+                help='Per rush type override of rush_pool_size, as a list '
+                     'of rush_type_id:size'),
+    cfg.IntOpt('rush_pool_refill_interval',
+               default=60,
+               help='Seconds between checks of the warm pool'),
+    cfg.StrOpt('rush_endpoint_output',
+               default='RushEndpoint',
+               help='Stack output holding the rush endpoint, for the rush '
+                    'type templates that declare it'),
+    cfg.IntOpt('rush_coalesce_ttl_ms',
+               default=250,
+               help='Milliseconds the result of a rush read is reused for '
+                    'identical reads (0 only coalesces the concurrent '
+                    'ones)'),
+    cfg.IntOpt('rush_batch_max_size',
+               default=100,
+               help='Maximum number of operations in a batch request'),
+    cfg.IntOpt('rush_batch_concurrency',
+               default=10,
+               help='Maximum number of operations of a batch request run '
+                    'at the same time'),
+    cfg.IntOpt('heat_max_concurrency',
+               default=20,
+               help='Maximum number of HEAT operations the engine runs at '
+                    'the same time'),
+    cfg.IntOpt('heat_max_concurrency_per_tenant',
+               default=4,
+               help='Maximum number of HEAT operations the engine runs at '
+                    'the same time for a single tenant'),
+    cfg.IntOpt('heat_token_stale_duration',
+               default=120,
+               help='Seconds before its expiry when a cached keystone token '
+                    'is renewed'),
+    cfg.FloatOpt('endpoint_timeout_min',
+                 default=2.0,
+                 help='Lower bound, in seconds, of the adaptive timeout of '
+                      'the HEAT and keystone calls'),
+    cfg.FloatOpt('endpoint_timeout_max',
+                 default=60.0,
+                 help='Upper bound, in seconds, of the adaptive timeout of '
+                      'the HEAT and keystone calls'),
+    cfg.FloatOpt('endpoint_timeout_multiplier',
+                 default=3.0,
+                 help='The adaptive timeout is this multiple of the p99 '
+                      'latency of the endpoint'),
+    cfg.FloatOpt('endpoint_write_timeout',
+                 default=300.0,
+                 help='Timeout, in seconds, of the HEAT create, update and '
+                      'delete calls, which get no adaptive timeout'),
+    cfg.IntOpt('endpoint_latency_window',
+               default=200,
+               help='Number of recent calls whose latency is used to '
+                    'compute the p99 of an endpoint'),
+    cfg.IntOpt('endpoint_breaker_failures',
+               default=5,
+               help='Consecutive failures of an endpoint that open its '
+                    'circuit breaker'),
+    cfg.IntOpt('endpoint_breaker_reset',
+               default=30,
+               help='Seconds an open circuit breaker fails fast before '
+                    'letting a probe call through'),
     cfg.ListOpt('plugin_dirs',
                 default=['/usr/lib64/rushstack', '/usr/lib/rushstack'],
                 help='List of directories to search for Plugins')]
@@ -19,3 +19,37 @@ PARAM_KEYS = (
     'timeout_mins', 'disable_rollback'
 )
 
+RUSH_STATUSES = (
+    STATUS_CREATE_PENDING,
+    STATUS_CREATE_IN_PROGRESS, STATUS_CREATE_COMPLETE, STATUS_CREATE_FAILED,
+    STATUS_DELETE_IN_PROGRESS, STATUS_DELETE_COMPLETE, STATUS_DELETE_FAILED,
+    STATUS_ROLLBACK_COMPLETE, STATUS_ROLLBACK_FAILED
+) = (
+    'CREATE_PENDING',
+    'CREATE_IN_PROGRESS', 'CREATE_COMPLETE', 'CREATE_FAILED',
+    'DELETE_IN_PROGRESS', 'DELETE_COMPLETE', 'DELETE_FAILED',
+    'ROLLBACK_COMPLETE', 'ROLLBACK_FAILED'
+)
+
+# Statuses HEAT does not move a stack out of on its own
+RUSH_SETTLED_STATUSES = (
+    STATUS_CREATE_COMPLETE, STATUS_CREATE_FAILED,
+    STATUS_DELETE_COMPLETE, STATUS_DELETE_FAILED,
+    STATUS_ROLLBACK_COMPLETE, STATUS_ROLLBACK_FAILED
+)
+
+# Fields of each rush in the get_list response
+RUSH_LIST_FIELDS = ('id', 'name', 'type', 'endpoint', 'status')
+
+TASK_ACTIONS = (
+    TASK_CREATE, TASK_DELETE
+) = (
+    'CREATE', 'DELETE'
+)
+
+TASK_STATES = (
+    TASK_PENDING, TASK_RUNNING, TASK_FAILED
+) = (
+    'PENDING', 'RUNNING', 'FAILED'
+)
+
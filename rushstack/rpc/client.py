@@ -29,6 +29,8 @@ class EngineClient(rushstack.openstack.common.rpc.proxy.RpcProxy):
     API version history:
 
         1.0 - Initial version.
+        1.1 - Add batch_rush_operations.
+        1.2 - Add pagination, filters and field selection to get_list.
     '''
 
     BASE_RPC_API_VERSION = '1.0'
@@ -48,18 +50,30 @@ class EngineClient(rushstack.openstack.common.rpc.proxy.RpcProxy):
         return self.call(ctxt, self.make_msg('echo',
                                              msg=msg))
 
-    def get_list(self, ctxt, tenant_id):
+    def get_list(self, ctxt, tenant_id, limit=None, marker=None, status=None,
+                 rush_type_id=None, fields=None):
         """
         Get Rush services list for the tenant (ctxt should contain tenant_id).
 
         :param ctxt: RPC context
         :param tenant_id: tenant_id to check for Rush
+        :param limit: maximum number of rushes to return
+        :param marker: id of the last rush of the previous page
+        :param status: status or list of statuses to filter by
+        :param rush_type_id: rush type to filter by
+        :param fields: list of fields to return for each rush
         
         Returns: Response got from RPC server.
         Response sample: {'result': True, 'rushes': [{'id': '8483934393','name':'Rush prepro','type':1 ,'endpoint': 'http://10.1.1.1:5001', 'status': 'COMPLETED' }]}
         """
         return self.call(ctxt, self.make_msg('get_list',
-                                             tenant_id=tenant_id))
+                                             tenant_id=tenant_id,
+                                             limit=limit,
+                                             marker=marker,
+                                             status=status,
+                                             rush_type_id=rush_type_id,
+                                             fields=fields),
+                         version='1.2')
 
     def start_rush_stack(self, ctxt, tenant_id, rush_type_id, rush_name):
         """
@@ -93,16 +107,35 @@ class EngineClient(rushstack.openstack.common.rpc.proxy.RpcProxy):
                                              tenant_id=tenant_id,
                                              rush_id=rush_id))
 
-    def get_rush(self, req):
+    def batch_rush_operations(self, ctxt, tenant_id, operations):
+        """
+        Run several operations on the Rush services of the tenant
+
+        :param ctxt: RPC context
+        :param tenant_id: tenant_id owner of the Rushes
+        :param operations: list of operations. Each one is a dict with the
+                           action ('create', 'delete' or 'get') and its
+                           arguments (rush_type_id and rush_name for create,
+                           rush_id for delete and get)
+
+        Returns: Response got from RPC server.
+        Response sample: {'result': True, 'results': [{'result': True, 'rush_id': '8483934393'}]}
+        """
+        return self.call(ctxt, self.make_msg('batch_rush_operations',
+                                             tenant_id=tenant_id,
+                                             operations=operations),
+                         version='1.1')
+
+    def get_rush(self, ctxt, tenant_id, rush_id):
         """
         Get tenant RUSH details
         :param ctxt: RPC context
         :param tenant_id: tenant_id owner of the Rsuh
-        :param rush_id: Rush to stop
-        
+        :param rush_id: Rush to get
+
         Returns: Response got from RPC server.
-        Response sample: {'result': True, 'id': '8483934393','name':'Rush prepro','type':1 ,'endpoint': 'http://10.1.1.1:5001', 'status': 'COMPLETED', 'extdata': '{}'}
+        Response sample: {'result': True, 'rush_id': '8483934393', 'url': 'http://10.1.1.1:5001'}
         """
-        
-        #Call to RPC to get real details
-        return self.engine.get_rush(req.context,req.context.tenant_id,req.context.rush_id)
+        return self.call(ctxt, self.make_msg('get_rush',
+                                             tenant_id=tenant_id,
+                                             rush_id=rush_id))
@@ -0,0 +1,107 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Cost of a flush in a session holding thousands of rushes with extdata.
+
+The extdata documents are MutableDict columns: a flush must only look at
+the rushes whose document changed, not compare every loaded document
+with a copy of it as a MutableType column does.
+
+The timing comparison depends on the host, it only runs with the
+RUSHSTACK_BENCHMARKS environment variable set.
+"""
+
+import os
+import time
+import unittest
+
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy import orm
+
+from rushstack.db.sqlalchemy import models
+from rushstack.openstack.common import log as logging
+
+logger = logging.getLogger(__name__)
+
+SMALL = 500
+LARGE = 5000
+FLUSHES = 20
+
+
+class FlushCostBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = sqlalchemy.create_engine('sqlite://')
+        models.BASE.metadata.create_all(self.engine)
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context,
+                executemany):
+        self.statements.append(statement)
+
+    def _session(self, rushes):
+        '''Session holding that many loaded rushes with their extdata'''
+        session = orm.sessionmaker(bind=self.engine)()
+        session.execute(models.RushStack.__table__.delete())
+        session.execute(models.RushStack.__table__.insert(), [
+            {'id': 'rush-%d' % count, 'name': 'rush-%d' % count,
+             'stack_id': 'stack-%d' % count, 'rush_type_id': 1,
+             'status': 'CREATE_COMPLETE',
+             'extdata': {'links': [{'href': 'http://heat/%d' % count,
+                                    'rel': 'self'}]}}
+            for count in xrange(rushes)])
+        session.commit()
+        loaded = session.query(models.RushStack).all()
+        self.assertEqual(len(loaded), rushes)
+        return session, loaded
+
+    def _flush_time(self, rushes):
+        '''Seconds per flush of a single changed extdata'''
+        session, loaded = self._session(rushes)
+        del self.statements[:]
+        start = time.time()
+        for count in xrange(FLUSHES):
+            loaded[count].extdata['flushed'] = count
+            session.flush()
+        elapsed = time.time() - start
+
+        updates = [statement for statement in self.statements
+                   if statement.startswith('UPDATE')]
+        self.assertEqual(len(updates), FLUSHES)
+        session.rollback()
+        session.close()
+        return elapsed / FLUSHES
+
+    def test_flush_updates_only_the_changed_rush(self):
+        self._flush_time(LARGE)
+
+    @unittest.skipUnless(os.environ.get('RUSHSTACK_BENCHMARKS'),
+                         'set RUSHSTACK_BENCHMARKS to run the benchmarks')
+    def test_flush_cost_does_not_grow_with_the_session(self):
+        small = self._flush_time(SMALL)
+        large = self._flush_time(LARGE)
+        logger.info('Flush of one changed extdata: %.2fms with %d rushes '
+                    'loaded, %.2fms with %d' %
+                    (small * 1000, SMALL, large * 1000, LARGE))
+        #Ten times the rushes must not cost anything near ten times more
+        self.assertTrue(large < 3 * small + 0.001)
+
+    def test_unchanged_session_flushes_nothing(self):
+        session, loaded = self._session(LARGE)
+        del self.statements[:]
+        session.flush()
+        self.assertEqual(self.statements, [])
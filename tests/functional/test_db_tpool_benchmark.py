@@ -0,0 +1,121 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Throughput of concurrent engine DB reads with db_use_tpool on and off.
+
+Each statement sleeps DB_LATENCY seconds in a native (not green) sleep
+before it runs, the way a blocking driver such as MySQL-python waits on
+the network. Without the thread pool the green threads of the handlers
+run their queries one at a time.
+
+The throughput comparison depends on the host, it only runs with the
+RUSHSTACK_BENCHMARKS environment variable set.
+"""
+
+import os
+import tempfile
+import time
+import unittest
+
+from eventlet import greenpool
+from eventlet import patcher
+from eventlet import tpool
+from oslo.config import cfg
+from sqlalchemy import event
+
+from rushstack.db import api as db_api
+from rushstack.db import utils
+from rushstack.db.sqlalchemy import models
+from rushstack.db.sqlalchemy import session as db_session
+from rushstack.openstack.common import log as logging
+
+logger = logging.getLogger(__name__)
+
+native_time = patcher.original('time')
+
+TENANT_ID = 'benchmark'
+RUSHES = 20
+# Seconds each statement waits before it runs
+DB_LATENCY = 0.01
+# Concurrent handlers and the calls they make in all
+CONCURRENCY = 20
+CALLS = 100
+
+
+class TpoolThroughputBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        cfg.CONF.set_override('sql_connection', 'sqlite:///' + self.db_path)
+        db_api.configure()
+        db_session.reset()
+
+        engine = db_session.get_engine()
+        models.BASE.metadata.create_all(engine)
+        backend = self._backend(False)
+        for count in xrange(RUSHES):
+            rush_id = 'rush-%d' % count
+            backend.rush_stack_create_for_tenant(
+                None, {'id': rush_id, 'name': rush_id, 'stack_id': rush_id,
+                       'rush_type_id': 1, 'status': 'CREATE_COMPLETE'},
+                TENANT_ID)
+        event.listen(engine, 'before_cursor_execute', self._db_latency)
+
+    def tearDown(self):
+        tpool.killall()
+        db_session.reset()
+        cfg.CONF.clear_override('db_use_tpool')
+        cfg.CONF.clear_override('sql_connection')
+        db_api.configure()
+        os.remove(self.db_path)
+
+    def _db_latency(self, conn, cursor, statement, parameters, context,
+                    executemany):
+        native_time.sleep(DB_LATENCY)
+
+    def _backend(self, use_tpool):
+        cfg.CONF.set_override('db_use_tpool', use_tpool)
+        return db_api.DBBackend(utils.LazyPluggable(
+            'db_backend', sqlalchemy='rushstack.db.sqlalchemy.api'))
+
+    def _throughput(self, use_tpool):
+        backend = self._backend(use_tpool)
+        green_pool = greenpool.GreenPool(CONCURRENCY)
+
+        def handler(count):
+            return backend.rush_stack_get_all_by_tenant(None, TENANT_ID)
+
+        start = time.time()
+        results = list(green_pool.imap(handler, xrange(CALLS)))
+        elapsed = time.time() - start
+
+        self.assertEqual([len(rushes) for rushes in results],
+                         [RUSHES] * CALLS)
+        return CALLS / elapsed
+
+    def test_tpool_reads_return_all_rushes(self):
+        self._throughput(False)
+        self._throughput(True)
+
+    @unittest.skipUnless(os.environ.get('RUSHSTACK_BENCHMARKS'),
+                         'set RUSHSTACK_BENCHMARKS to run the benchmarks')
+    def test_tpool_throughput(self):
+        blocking = self._throughput(False)
+        pooled = self._throughput(True)
+        logger.info('DB reads/s with %d concurrent handlers and %.0fms per '
+                    'statement: db_use_tpool off %.1f, on %.1f' %
+                    (CONCURRENCY, DB_LATENCY * 1000, blocking, pooled))
+        self.assertTrue(pooled > 2 * blocking)
@@ -0,0 +1,111 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Routing of the read only queries to a read replica, with the master and the
+replica as two in-memory SQLite databases
+"""
+
+import unittest
+
+from oslo.config import cfg
+
+from rushstack.common import context
+from rushstack.db import api as db_api
+from rushstack.db.sqlalchemy import models
+from rushstack.db.sqlalchemy import session as db_session
+from rushstack.engine import cache
+from rushstack.rpc import api as rpc_api
+from tests.unit import utils
+
+TENANT_ID = 'tenant'
+
+
+class ReadReplicaTest(unittest.TestCase):
+
+    def setUp(self):
+        cfg.CONF.set_override('sql_read_connection', ['sqlite://'])
+        cfg.CONF.set_override('sql_read_after_write_window', 0)
+        utils.setup_dummy_db()
+        db_session.get_read_session()
+        self.replica = db_session._READ_ENGINES[0]
+        models.BASE.metadata.create_all(self.replica)
+        self.ctxt = context.get_admin_context()
+
+    def tearDown(self):
+        utils.reset_dummy_db()
+        cfg.CONF.clear_override('sql_read_connection')
+        cfg.CONF.clear_override('sql_read_after_write_window')
+        db_api.configure()
+
+    def _replicate(self, rush_id, status):
+        '''Add the rush to the replica, with its own status'''
+        self.replica.execute(models.RushStack.__table__.insert(),
+                             {'id': rush_id, 'name': rush_id,
+                              'stack_id': rush_id, 'rush_type_id': 1,
+                              'status': status})
+        self.replica.execute(models.RushTenant.__table__.insert(),
+                             {'rush_id': rush_id, 'tenant_id': TENANT_ID})
+
+    def test_reads_go_to_the_replica(self):
+        utils.create_rush(self.ctxt, 'rush', TENANT_ID,
+                          status=rpc_api.STATUS_CREATE_COMPLETE)
+        self._replicate('rush', rpc_api.STATUS_CREATE_IN_PROGRESS)
+
+        self.assertEqual(db_api.rush_stack_get(self.ctxt, 'rush').status,
+                         rpc_api.STATUS_CREATE_IN_PROGRESS)
+        rushes = db_api.rush_stack_get_all_by_tenant(self.ctxt, TENANT_ID)
+        self.assertEqual([rush.status for rush in rushes],
+                         [rpc_api.STATUS_CREATE_IN_PROGRESS])
+
+    def test_rush_missing_on_the_replica_is_read_from_the_master(self):
+        utils.create_rush(self.ctxt, 'rush', TENANT_ID)
+
+        self.assertEqual(db_api.rush_stack_get(self.ctxt, 'rush').id, 'rush')
+        self.assertEqual(db_api.rush_tenant_get_by_rush_and_tenant(
+            self.ctxt, 'rush', TENANT_ID).tenant_id, TENANT_ID)
+        self.assertEqual(db_api.rush_stack_get(self.ctxt, 'missing'), None)
+
+    def test_master_reads(self):
+        utils.create_rush(self.ctxt, 'rush', TENANT_ID,
+                          status=rpc_api.STATUS_CREATE_COMPLETE)
+        self._replicate('rush', rpc_api.STATUS_CREATE_IN_PROGRESS)
+
+        self.ctxt.read_from_master = True
+        self.assertEqual(db_api.rush_stack_get(self.ctxt, 'rush').status,
+                         rpc_api.STATUS_CREATE_COMPLETE)
+
+        self.ctxt.read_from_master = False
+        with self.ctxt.transaction():
+            rushes = db_api.rush_stack_get_all_by_tenant(self.ctxt, TENANT_ID)
+            self.assertEqual([rush.status for rush in rushes],
+                             [rpc_api.STATUS_CREATE_COMPLETE])
+
+    def test_reads_after_a_write_go_to_the_master(self):
+        cfg.CONF.set_override('sql_read_after_write_window', 60)
+        utils.create_rush(self.ctxt, 'rush', TENANT_ID,
+                          status=rpc_api.STATUS_CREATE_COMPLETE)
+        self._replicate('rush', rpc_api.STATUS_CREATE_IN_PROGRESS)
+
+        rushes = db_api.rush_stack_get_all_by_tenant(self.ctxt, TENANT_ID)
+        self.assertEqual([rush.status for rush in rushes],
+                         [rpc_api.STATUS_CREATE_COMPLETE])
+
+    def test_cached_list_leaves_the_context_alone(self):
+        self._replicate('rush', rpc_api.STATUS_CREATE_IN_PROGRESS)
+        rush_cache = cache.RushCache(10, 60)
+
+        rushes = rush_cache.get_list(self.ctxt, TENANT_ID)
+        self.assertEqual([rush['id'] for rush in rushes], ['rush'])
+        self.assertFalse(self.ctxt.read_from_master)
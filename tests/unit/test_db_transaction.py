@@ -0,0 +1,112 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Transactions of the request contexts, on an in-memory SQLite database
+"""
+
+import unittest
+
+import eventlet
+
+from rushstack.common import context
+from rushstack.db import api as db_api
+from rushstack.db.sqlalchemy import models
+from rushstack.rpc import api as rpc_api
+from tests.unit import utils
+
+TENANT_ID = 'tenant'
+
+
+class TransactionTest(unittest.TestCase):
+
+    def setUp(self):
+        utils.setup_dummy_db()
+        self.ctxt = context.get_admin_context()
+        self.ctxt.read_from_master = True
+
+    def tearDown(self):
+        utils.reset_dummy_db()
+
+    def _rush_ids(self):
+        return sorted(rush.id for rush in
+                      self.ctxt.session.query(models.RushStack).all())
+
+    def _add_pool_stack(self):
+        db_api.rush_pool_create(self.ctxt, {'id': 'pooled',
+                                            'rush_type_id': 1,
+                                            'stack_id': 'pooled',
+                                            'status':
+                                            rpc_api.STATUS_CREATE_COMPLETE})
+
+    def test_commit(self):
+        with self.ctxt.transaction():
+            self.assertTrue(self.ctxt.in_transaction)
+            utils.create_rush(self.ctxt, 'rush', TENANT_ID)
+            db_api.rush_stack_update(self.ctxt, 'rush', {'url': 'http://url'})
+        self.assertFalse(self.ctxt.in_transaction)
+
+        self.ctxt.session.expunge_all()
+        self.assertEqual(db_api.rush_stack_get(self.ctxt, 'rush').url,
+                         'http://url')
+
+    def test_rollback_on_error(self):
+        def create():
+            with self.ctxt.transaction():
+                utils.create_rush(self.ctxt, 'rush', TENANT_ID)
+                raise ValueError('failed')
+        self.assertRaises(ValueError, create)
+
+        self.assertFalse(self.ctxt.in_transaction)
+        self.assertEqual(self._rush_ids(), [])
+        self.assertEqual(db_api.rush_tenant_get_all_by_tenant(self.ctxt,
+                                                              TENANT_ID), [])
+
+    def test_rollback_on_timeout(self):
+        #eventlet.Timeout is a BaseException, not an Exception
+        def create():
+            with eventlet.Timeout(0.01):
+                with self.ctxt.transaction():
+                    utils.create_rush(self.ctxt, 'rush', TENANT_ID)
+                    eventlet.sleep(1)
+        self.assertRaises(eventlet.Timeout, create)
+
+        self.assertFalse(self.ctxt.in_transaction)
+        self.assertEqual(self._rush_ids(), [])
+
+    def test_nested_scopes_commit_with_the_outermost(self):
+        def create():
+            with self.ctxt.transaction():
+                with self.ctxt.transaction():
+                    utils.create_rush(self.ctxt, 'one', TENANT_ID)
+                self.assertTrue(self.ctxt.in_transaction)
+                utils.create_rush(self.ctxt, 'two', TENANT_ID)
+                raise ValueError('failed')
+        self.assertRaises(ValueError, create)
+
+        self.assertEqual(self._rush_ids(), [])
+
+    def test_pool_claim_and_rush_are_committed_together(self):
+        self._add_pool_stack()
+
+        def claim():
+            with self.ctxt.transaction():
+                db_api.rush_pool_claim(self.ctxt, 1, 'rush',
+                                       rpc_api.STATUS_CREATE_COMPLETE)
+                raise ValueError('failed')
+        self.assertRaises(ValueError, claim)
+
+        pooled = self.ctxt.session.query(models.RushPool).\
+            populate_existing().get('pooled')
+        self.assertEqual(pooled.rush_id, None)
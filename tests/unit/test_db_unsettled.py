@@ -0,0 +1,98 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Query plan of the reconciler scan of the unsettled rushes, on an in-memory
+SQLite database built by the migrations
+"""
+
+import re
+import unittest
+
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy import orm
+
+from rushstack.db import migration
+from rushstack.db.sqlalchemy import api as db_api
+from rushstack.db.sqlalchemy import migration as db_migration
+from rushstack.rpc import api as rpc_api
+
+# Plan rows reading the rush_stack table (not the index or a subquery)
+RUSH_STACK = re.compile(r'\brush_stack\b')
+
+
+class FakeContext(object):
+    read_from_master = True
+    in_transaction = False
+
+    def __init__(self, session):
+        self.session = session
+
+
+class UnsettledScanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = sqlalchemy.create_engine('sqlite://')
+        repository = db_migration._find_migrate_repo()
+        db_migration.versioning_api.version_control(self.engine, repository,
+                                                    migration.INIT_VERSION)
+        db_migration.versioning_api.upgrade(self.engine, repository)
+        session = orm.sessionmaker(bind=self.engine, autocommit=True)()
+        self.context = FakeContext(session)
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context,
+                executemany):
+        self.statements.append((statement, parameters))
+
+    def _add_rush(self, rush_id, status, url=None):
+        self.engine.execute(
+            "INSERT INTO rush_stack (id, stack_id, rush_type_id, status, url)"
+            " VALUES (?, ?, 1, ?, ?)", (rush_id, rush_id, status, url))
+
+    def _unsettled(self):
+        del self.statements[:]
+        return db_api.rush_stack_get_all_unsettled(
+            self.context, rpc_api.RUSH_SETTLED_STATUSES)
+
+    def test_scan_uses_status_url_index(self):
+        self._unsettled()
+        self.assertEqual(len(self.statements), 1)
+        statement, parameters = self.statements.pop()
+        plan = [row[-1] for row in self.engine.execute(
+            'EXPLAIN QUERY PLAN ' + statement, parameters)]
+
+        reads = [detail for detail in plan if RUSH_STACK.search(detail)]
+        self.assertTrue(reads)
+        for detail in reads:
+            self.assertFalse(detail.startswith('SCAN'), plan)
+            self.assertTrue('USING INDEX ix_rush_stack_status_url' in detail,
+                            plan)
+
+    def test_scan_returns_unsettled_rushes(self):
+        self._add_rush('pending', rpc_api.STATUS_CREATE_PENDING)
+        self._add_rush('creating', rpc_api.STATUS_CREATE_IN_PROGRESS)
+        self._add_rush('deleting', rpc_api.STATUS_DELETE_IN_PROGRESS)
+        self._add_rush('rolling_back', 'ROLLBACK_IN_PROGRESS')
+        self._add_rush('no_url', rpc_api.STATUS_CREATE_COMPLETE)
+        self._add_rush('complete', rpc_api.STATUS_CREATE_COMPLETE,
+                       'http://10.0.0.1:5001')
+        for status in rpc_api.RUSH_SETTLED_STATUSES:
+            self._add_rush(status.lower(), status, 'http://10.0.0.2:5001')
+
+        rush_ids = sorted(rush.id for rush in self._unsettled())
+        self.assertEqual(rush_ids, ['creating', 'deleting', 'no_url',
+                                    'pending', 'rolling_back'])
@@ -0,0 +1,106 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Bulk update of the rushes, on an in-memory SQLite database
+"""
+
+import unittest
+
+from sqlalchemy import event
+
+from rushstack.common import context
+from rushstack.db import api as db_api
+from rushstack.db.sqlalchemy import models
+from rushstack.db.sqlalchemy import session as db_session
+from rushstack.rpc import api as rpc_api
+from tests.unit import utils
+
+TENANT_ID = 'tenant'
+
+
+class UpdateManyTest(unittest.TestCase):
+
+    def setUp(self):
+        utils.setup_dummy_db()
+        self.ctxt = context.get_admin_context()
+        self.ctxt.read_from_master = True
+        for count in xrange(5):
+            utils.create_rush(self.ctxt, 'rush-%d' % count, TENANT_ID,
+                              status=rpc_api.STATUS_CREATE_IN_PROGRESS)
+        self.statements = []
+        event.listen(db_session.get_engine(), 'before_cursor_execute',
+                     self._record)
+
+    def tearDown(self):
+        utils.reset_dummy_db()
+
+    def _record(self, conn, cursor, statement, parameters, context,
+                executemany):
+        if statement.startswith('UPDATE'):
+            self.statements.append((statement, executemany))
+
+    def _rushes(self):
+        query = self.ctxt.session.query(models.RushStack).populate_existing()
+        return dict((rush.id, rush) for rush in query.all())
+
+    def test_same_values_share_one_statement(self):
+        db_api.rush_stack_update_many(self.ctxt, dict(
+            ('rush-%d' % count, {'status': rpc_api.STATUS_CREATE_COMPLETE})
+            for count in xrange(4)))
+
+        self.assertEqual(len(self.statements), 1)
+        self.assertTrue(' IN ' in self.statements[0][0])
+        rushes = self._rushes()
+        for count in xrange(4):
+            rush = rushes['rush-%d' % count]
+            self.assertEqual(rush.status, rpc_api.STATUS_CREATE_COMPLETE)
+            self.assertTrue(rush.updated_at is not None)
+        self.assertEqual(rushes['rush-4'].status,
+                         rpc_api.STATUS_CREATE_IN_PROGRESS)
+        self.assertEqual(rushes['rush-4'].updated_at, None)
+
+    def test_own_values_are_grouped_by_columns(self):
+        db_api.rush_stack_update_many(self.ctxt, {
+            'rush-0': {'status': rpc_api.STATUS_CREATE_COMPLETE,
+                       'url': 'http://10.0.0.0:5001'},
+            'rush-1': {'status': rpc_api.STATUS_CREATE_COMPLETE,
+                       'url': 'http://10.0.0.1:5001'},
+            'rush-2': {'status': rpc_api.STATUS_CREATE_FAILED}})
+
+        self.assertEqual(len(self.statements), 2)
+        self.assertEqual(sorted(executemany for statement, executemany
+                                in self.statements), [False, True])
+        rushes = self._rushes()
+        self.assertEqual(rushes['rush-0'].url, 'http://10.0.0.0:5001')
+        self.assertEqual(rushes['rush-1'].url, 'http://10.0.0.1:5001')
+        self.assertEqual(rushes['rush-1'].status,
+                         rpc_api.STATUS_CREATE_COMPLETE)
+        self.assertEqual(rushes['rush-2'].status,
+                         rpc_api.STATUS_CREATE_FAILED)
+        self.assertEqual(rushes['rush-2'].url, None)
+
+    def test_unhashable_values(self):
+        links = {'links': [{'href': 'http://heat/rush-0', 'rel': 'self'}]}
+        db_api.rush_stack_update_many(self.ctxt, {
+            'rush-0': {'extdata': links},
+            'rush-1': {'extdata': links}})
+
+        rushes = self._rushes()
+        self.assertEqual(rushes['rush-0'].extdata, links)
+        self.assertEqual(rushes['rush-1'].extdata, links)
+
+    def test_no_updates(self):
+        db_api.rush_stack_update_many(self.ctxt, {})
+        self.assertEqual(self.statements, [])
@@ -0,0 +1,98 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Batch rush operations of the engine, with a fake HEAT client
+"""
+
+import unittest
+
+from oslo.config import cfg
+
+from rushstack.common import context
+from rushstack.db import api as db_api
+from rushstack.engine import service
+from rushstack.rpc import api as rpc_api
+from tests.unit import utils
+
+TENANT_ID = 'tenant'
+
+
+class BatchOperationsTest(unittest.TestCase):
+
+    def setUp(self):
+        utils.setup_dummy_db()
+        utils.create_rush_type()
+        #Keep the queued tasks in the DB, the poll spawned by the batch
+        #must not run them
+        cfg.CONF.set_override('rush_task_concurrency', 0)
+        self.engine = service.EngineService('host', rpc_api.ENGINE_TOPIC)
+        self.heat = utils.FakeHeatClient()
+        self.engine._heat = lambda: self.heat
+        self.ctxt = context.get_admin_context()
+        self.ctxt.read_from_master = True
+
+    def tearDown(self):
+        self.engine.tg.stop()
+        cfg.CONF.clear_override('rush_task_concurrency')
+        cfg.CONF.clear_override('rush_batch_max_size')
+        utils.reset_dummy_db()
+
+    def test_create_answers_pending_without_calling_heat(self):
+        result = self.engine.batch_rush_operations(
+            self.ctxt, TENANT_ID,
+            [{'action': 'create', 'rush_type_id': 1, 'rush_name': 'one'},
+             {'action': 'create', 'rush_type_id': 1, 'rush_name': 'two'}])
+
+        self.assertTrue(result['result'])
+        self.assertEqual(len(result['results']), 2)
+        for created in result['results']:
+            self.assertTrue(created['result'])
+            self.assertEqual(created['status'], rpc_api.STATUS_CREATE_PENDING)
+            rush = db_api.rush_stack_get(self.ctxt, created['rush_id'])
+            self.assertEqual(rush.status, rpc_api.STATUS_CREATE_PENDING)
+        self.assertEqual(self.heat.stacks.created, [])
+
+        rush_ids = db_api.rush_task_get_rush_ids(self.ctxt,
+                                                 rpc_api.TASK_CREATE,
+                                                 (rpc_api.TASK_PENDING,))
+        self.assertEqual(sorted(rush_ids),
+                         sorted(created['rush_id']
+                                for created in result['results']))
+
+    def test_results_keep_the_order_of_the_operations(self):
+        result = self.engine.batch_rush_operations(
+            self.ctxt, TENANT_ID,
+            [{'action': 'get', 'rush_id': 'missing'},
+             {'action': 'create', 'rush_type_id': 1, 'rush_name': 'one'},
+             {'action': 'create', 'rush_type_id': 99, 'rush_name': 'two'},
+             {'action': 'resize'}])
+
+        results = result['results']
+        self.assertEqual(results[0]['error'], 'GETRUSHEX02')
+        self.assertTrue(results[1]['result'])
+        self.assertEqual(results[2]['error'], 'STARTRUSHEX02')
+        self.assertEqual(results[3]['error'], 'BATCHRUSHEX03')
+
+    def test_rejects_too_many_operations(self):
+        cfg.CONF.set_override('rush_batch_max_size', 1)
+        result = self.engine.batch_rush_operations(
+            self.ctxt, TENANT_ID, [{'action': 'get', 'rush_id': 'one'},
+                                   {'action': 'get', 'rush_id': 'two'}])
+        self.assertEqual(result['error'], 'BATCHRUSHEX02')
+
+    def test_rejects_operations_that_are_not_a_list(self):
+        result = self.engine.batch_rush_operations(
+            self.ctxt, TENANT_ID, {'action': 'get', 'rush_id': 'one'})
+        self.assertEqual(result['error'], 'BATCHRUSHEX01')
@@ -0,0 +1,141 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Coalescing of the concurrent identical reads of the engine
+"""
+
+import time
+import unittest
+
+import eventlet
+from eventlet import event
+from eventlet import greenpool
+
+from rushstack.engine import coalesce
+
+TTL = 60
+
+
+class Read(object):
+    '''Read function counting its executions, blocked until released'''
+
+    def __init__(self, result='result'):
+        self.result = result
+        self.calls = 0
+        self.released = event.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.released.wait()
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.flight = coalesce.SingleFlight(TTL)
+
+    def _concurrent(self, key, read, calls=5):
+        green_pool = greenpool.GreenPool()
+        results = []
+
+        def call():
+            try:
+                results.append(self.flight.run(key, read))
+            except Exception as e:
+                results.append(e)
+        for count in xrange(calls):
+            green_pool.spawn(call)
+        #Let every call reach the flight before the read returns
+        eventlet.sleep(0)
+        read.released.send()
+        green_pool.waitall()
+        return results
+
+    def _done(self, result='result'):
+        read = Read(result)
+        read.released.send()
+        return read
+
+    def test_concurrent_calls_share_one_execution(self):
+        read = Read()
+        results = self._concurrent(('get_list', 'tenant'), read)
+
+        self.assertEqual(results, ['result'] * 5)
+        self.assertEqual(read.calls, 1)
+        stats = self.flight.stats()
+        self.assertEqual(stats['executions'], 1)
+        self.assertEqual(stats['shared'], 4)
+
+    def test_concurrent_calls_share_the_exception(self):
+        error = ValueError('failed')
+        read = Read(error)
+        results = self._concurrent(('get_list', 'tenant'), read)
+
+        self.assertEqual(results, [error] * 5)
+        self.assertEqual(read.calls, 1)
+        #A failure is not kept
+        read = self._done()
+        self.assertEqual(self.flight.run(('get_list', 'tenant'), read),
+                         'result')
+        self.assertEqual(read.calls, 1)
+
+    def test_results_are_kept_for_ttl(self):
+        read = self._done()
+        key = ('get_list', 'tenant')
+        self.flight.run(key, read)
+        self.flight.run(key, read)
+        self.assertEqual(read.calls, 1)
+        self.assertEqual(self.flight.stats()['cached'], 1)
+
+        #Kept from an execution that started more than ttl seconds ago
+        self.flight._results.put(key, (time.time() - TTL - 1, 'old'))
+        self.assertEqual(self.flight.run(key, read), 'result')
+        self.assertEqual(read.calls, 2)
+
+    def test_no_ttl_only_coalesces(self):
+        self.flight = coalesce.SingleFlight(0)
+        read = self._done()
+        self.flight.run(('get_list', 'tenant'), read)
+        self.flight.run(('get_list', 'tenant'), read)
+        self.assertEqual(read.calls, 2)
+
+    def test_invalidate_drops_the_results_of_the_tenant(self):
+        read = self._done()
+        self.flight.run(('get_list', 'tenant'), read)
+        self.flight.run(('get_rush', 'tenant', 'rush'), read)
+        self.flight.run(('get_list', 'other'), read)
+        self.assertEqual(read.calls, 3)
+
+        time.sleep(0.01)
+        self.flight.invalidate('tenant')
+        self.flight.run(('get_list', 'tenant'), read)
+        self.flight.run(('get_rush', 'tenant', 'rush'), read)
+        self.flight.run(('get_list', 'other'), read)
+        self.assertEqual(read.calls, 5)
+
+        time.sleep(0.01)
+        self.flight.invalidate()
+        self.flight.run(('get_list', 'other'), read)
+        self.assertEqual(read.calls, 6)
+
+    def test_invalidations_older_than_ttl_are_forgotten(self):
+        self.flight._invalidated['old'] = time.time() - TTL - 1
+        self.flight._invalidated['recent'] = time.time()
+        self.flight.invalidate('tenant')
+        self.assertEqual(sorted(self.flight._invalidated),
+                         ['recent', 'tenant'])
@@ -0,0 +1,148 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Asynchronous rush deletion: stop_rush_stack and the reconciliation of the
+DELETE_IN_PROGRESS rushes, with a fake HEAT client
+"""
+
+import time
+import unittest
+
+from oslo.config import cfg
+
+from rushstack.common import context
+from rushstack.db import api as db_api
+from rushstack.db.sqlalchemy import models
+from rushstack.engine import service
+from rushstack.rpc import api as rpc_api
+from tests.unit import utils
+
+TENANT_ID = 'tenant'
+URL = 'http://10.0.0.1:5001'
+
+
+class DeleteTest(unittest.TestCase):
+
+    def setUp(self):
+        utils.setup_dummy_db()
+        #Keep the queued tasks in the DB, the polls spawned by the engine
+        #must not run them
+        cfg.CONF.set_override('rush_task_concurrency', 0)
+        self.engine = service.EngineService('host', rpc_api.ENGINE_TOPIC)
+        self.heat = utils.FakeHeatClient()
+        self.engine._heat = lambda: self.heat
+        self.ctxt = context.get_admin_context()
+        self.ctxt.read_from_master = True
+
+    def tearDown(self):
+        self.engine.tg.stop()
+        cfg.CONF.clear_override('rush_task_concurrency')
+        utils.reset_dummy_db()
+
+    def _add(self, rush_id, status, heat_status=None):
+        utils.create_rush(self.ctxt, rush_id, TENANT_ID, status=status,
+                          url=URL)
+        if heat_status is not None:
+            self.heat.stacks.add(rush_id, heat_status)
+
+    def _rush(self, rush_id):
+        return self.ctxt.session.query(models.RushStack).\
+            populate_existing().get(rush_id)
+
+    def _reconcile(self, *rush_ids):
+        rushes = [self._rush(rush_id) for rush_id in rush_ids]
+        self.engine._reconcile_rushes(self.ctxt, rushes, {}, time.time())
+
+    def test_stop_marks_the_rush_and_queues_the_delete(self):
+        self._add('rush', rpc_api.STATUS_CREATE_COMPLETE,
+                  rpc_api.STATUS_CREATE_COMPLETE)
+
+        result = self.engine.stop_rush_stack(self.ctxt, TENANT_ID, 'rush')
+        self.assertEqual(result, {'result': True, 'rush_id': 'rush'})
+        self.assertEqual(self._rush('rush').status,
+                         rpc_api.STATUS_DELETE_IN_PROGRESS)
+        self.assertEqual(db_api.rush_task_get_rush_ids(
+            self.ctxt, rpc_api.TASK_DELETE, (rpc_api.TASK_PENDING,)),
+            ['rush'])
+        #HEAT is only called by the task
+        self.assertEqual(self.heat.stacks.deleted, [])
+
+        #Stopping it again queues nothing more
+        result = self.engine.stop_rush_stack(self.ctxt, TENANT_ID, 'rush')
+        self.assertTrue(result['result'])
+        self.assertEqual(len(self.ctxt.session.query(models.RushTask).all()),
+                         1)
+
+    def test_stop_checks_the_tenant_and_the_stack(self):
+        self._add('rush', rpc_api.STATUS_CREATE_COMPLETE)
+        utils.create_rush(self.ctxt, 'pending', TENANT_ID,
+                          status=rpc_api.STATUS_CREATE_PENDING, stack_id='')
+
+        result = self.engine.stop_rush_stack(self.ctxt, 'other', 'rush')
+        self.assertEqual(result['error'], 'STOPRUSHEX02')
+        result = self.engine.stop_rush_stack(self.ctxt, TENANT_ID, 'pending')
+        self.assertEqual(result['error'], 'STOPRUSHEX03')
+        result = self.engine.stop_rush_stack(self.ctxt, TENANT_ID, 'missing')
+        self.assertEqual(result['error'], 'STOPRUSHEX01')
+
+    def test_deleted_stacks_purge_their_rushes(self):
+        self._add('gone', rpc_api.STATUS_DELETE_IN_PROGRESS)
+        self._add('deleted', rpc_api.STATUS_DELETE_IN_PROGRESS,
+                  rpc_api.STATUS_DELETE_COMPLETE)
+
+        self._reconcile('gone', 'deleted')
+
+        self.assertEqual(self._rush('gone'), None)
+        self.assertEqual(self._rush('deleted'), None)
+        self.assertEqual(db_api.rush_tenant_get_all_by_tenant(self.ctxt,
+                                                              TENANT_ID), [])
+
+    def test_deleting_rush_keeps_its_status_until_heat_deletes(self):
+        self._add('deleting', rpc_api.STATUS_DELETE_IN_PROGRESS,
+                  rpc_api.STATUS_CREATE_COMPLETE)
+
+        self._reconcile('deleting')
+
+        self.assertEqual(self._rush('deleting').status,
+                         rpc_api.STATUS_DELETE_IN_PROGRESS)
+
+    def test_delete_failure_is_kept_unless_a_delete_is_queued(self):
+        self._add('failed', rpc_api.STATUS_DELETE_IN_PROGRESS,
+                  rpc_api.STATUS_DELETE_FAILED)
+        self._add('retried', rpc_api.STATUS_DELETE_IN_PROGRESS,
+                  rpc_api.STATUS_DELETE_FAILED)
+        db_api.rush_task_create(self.ctxt, self.engine.tasks.new_task(
+            rpc_api.TASK_DELETE, 'retried', TENANT_ID,
+            {'stack_id': 'retried'}))
+
+        self._reconcile('failed', 'retried')
+
+        self.assertEqual(self._rush('failed').status,
+                         rpc_api.STATUS_DELETE_FAILED)
+        self.assertEqual(self._rush('retried').status,
+                         rpc_api.STATUS_DELETE_IN_PROGRESS)
+
+    def test_stack_deleted_out_of_band(self):
+        self._add('vanished', rpc_api.STATUS_CREATE_COMPLETE)
+        self._add('unlisted', rpc_api.STATUS_CREATE_COMPLETE,
+                  rpc_api.STATUS_CREATE_COMPLETE)
+        self.heat.stacks.hidden.add('unlisted')
+
+        self._reconcile('vanished', 'unlisted')
+
+        self.assertEqual(self._rush('vanished').status,
+                         rpc_api.STATUS_DELETE_COMPLETE)
+        self.assertEqual(self._rush('unlisted').status,
+                         rpc_api.STATUS_CREATE_COMPLETE)
@@ -0,0 +1,124 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Engine leases and the leader election, on an in-memory SQLite database
+"""
+
+import datetime
+import unittest
+
+from sqlalchemy import event
+
+from rushstack.common import context
+from rushstack.db import api as db_api
+from rushstack.db.sqlalchemy import models
+from rushstack.db.sqlalchemy import session as db_session
+from rushstack.engine import leader
+from rushstack.openstack.common import timeutils
+from tests.unit import utils
+
+LEASE = 'lease'
+DURATION = 60
+
+
+class EngineLeaseTest(unittest.TestCase):
+
+    def setUp(self):
+        utils.setup_dummy_db()
+        self.ctxt = context.get_admin_context()
+        self.ctxt.read_from_master = True
+        self.racing = None
+        event.listen(db_session.get_engine(), 'before_cursor_execute',
+                     self._race)
+
+    def tearDown(self):
+        utils.reset_dummy_db()
+
+    def _race(self, conn, cursor, statement, parameters, context,
+              executemany):
+        '''
+        Once armed, let another engine create the lease right before this
+        one inserts it
+        '''
+        if self.racing and statement.startswith('INSERT INTO engine_lease'):
+            owner, self.racing = self.racing, None
+            expires_at = timeutils.utcnow() + datetime.timedelta(
+                seconds=DURATION)
+            cursor.execute('INSERT INTO engine_lease (name, owner, '
+                           'expires_at) VALUES (?, ?, ?)',
+                           (LEASE, owner, str(expires_at)))
+
+    def _expire(self):
+        table = models.EngineLease.__table__
+        db_session.get_engine().execute(
+            table.update().where(table.c.name == LEASE).
+            values(expires_at=timeutils.utcnow() -
+                   datetime.timedelta(seconds=1)))
+
+    def _acquire(self, owner):
+        return db_api.engine_lease_acquire(self.ctxt, LEASE, owner, DURATION)
+
+    def test_lease_is_held_until_it_expires(self):
+        self.assertTrue(self._acquire('one'))
+        self.assertFalse(self._acquire('two'))
+        self.assertTrue(self._acquire('one'))
+
+        self._expire()
+        self.assertTrue(self._acquire('two'))
+        self.assertFalse(self._acquire('one'))
+
+    def test_released_lease_is_taken_at_once(self):
+        self.assertTrue(self._acquire('one'))
+        db_api.engine_lease_release(self.ctxt, LEASE, 'two')
+        self.assertFalse(self._acquire('two'))
+
+        db_api.engine_lease_release(self.ctxt, LEASE, 'one')
+        self.assertTrue(self._acquire('two'))
+
+    def test_lost_creation_race(self):
+        self.racing = 'two'
+        self.assertFalse(self._acquire('one'))
+        #The failed insert left the session usable
+        self.assertTrue(self._acquire('one'))
+
+
+class LeaderElectionTest(unittest.TestCase):
+
+    def setUp(self):
+        utils.setup_dummy_db()
+        self.ctxt = context.get_admin_context()
+        self.ctxt.read_from_master = True
+
+    def tearDown(self):
+        utils.reset_dummy_db()
+
+    def test_single_leader(self):
+        one = leader.LeaderElection('one')
+        two = leader.LeaderElection('two')
+
+        one.renew(self.ctxt)
+        two.renew(self.ctxt)
+        self.assertTrue(one.is_leader)
+        self.assertFalse(two.is_leader)
+
+        one.renew(self.ctxt)
+        self.assertEqual(one.stats()['elections'], 1)
+
+        one.release(self.ctxt)
+        self.assertFalse(one.is_leader)
+        two.renew(self.ctxt)
+        self.assertTrue(two.is_leader)
+        one.renew(self.ctxt)
+        self.assertFalse(one.is_leader)
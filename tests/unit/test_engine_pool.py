@@ -0,0 +1,151 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Claim and refresh of the warm pool, on an in-memory SQLite database with a
+fake HEAT client
+"""
+
+import datetime
+import unittest
+
+from oslo.config import cfg
+
+from rushstack.common import context
+from rushstack.db import api as db_api
+from rushstack.db.sqlalchemy import models
+from rushstack.db.sqlalchemy import session as db_session
+from rushstack.engine import pool
+from rushstack.openstack.common import timeutils
+from rushstack.rpc import api as rpc_api
+from tests.unit import utils
+
+RUSH_TYPE_ID = 1
+
+
+class WarmPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        utils.setup_dummy_db()
+        cfg.CONF.set_override('rush_pool_size', 2)
+        self.pool = pool.WarmPool()
+        self.heat = utils.FakeHeatClient()
+        self.ctxt = context.get_admin_context()
+        self.ctxt.read_from_master = True
+
+    def tearDown(self):
+        cfg.CONF.clear_override('rush_pool_size')
+        utils.reset_dummy_db()
+
+    def _add(self, pool_id, status, rush_id=None):
+        self.heat.stacks.add(pool_id, status)
+        db_api.rush_pool_create(self.ctxt, {'id': pool_id,
+                                            'rush_type_id': RUSH_TYPE_ID,
+                                            'stack_id': pool_id,
+                                            'stack_name': pool_id,
+                                            'status': status,
+                                            'rush_id': rush_id})
+
+    def _entries(self):
+        query = self.ctxt.session.query(models.RushPool).populate_existing()
+        return dict((entry.id, entry) for entry in query.all())
+
+    def _claimed_long_ago(self, pool_id):
+        table = models.RushPool.__table__
+        long_ago = timeutils.utcnow() - datetime.timedelta(
+            seconds=cfg.CONF.rush_pool_refill_interval + 60)
+        db_session.get_engine().execute(
+            table.update().where(table.c.id == pool_id).
+            values(updated_at=long_ago))
+
+    def test_claim_prefers_complete_stacks(self):
+        self._add('in-progress', rpc_api.STATUS_CREATE_IN_PROGRESS)
+        self._add('complete', rpc_api.STATUS_CREATE_COMPLETE)
+
+        pooled = self.pool.claim(self.ctxt, RUSH_TYPE_ID, 'rush-1')
+        self.assertEqual(pooled.id, 'complete')
+        self.assertEqual(pooled.rush_id, 'rush-1')
+        pooled = self.pool.claim(self.ctxt, RUSH_TYPE_ID, 'rush-2')
+        self.assertEqual(pooled.id, 'in-progress')
+
+        self.assertEqual(self.pool.claim(self.ctxt, RUSH_TYPE_ID, 'rush-3'),
+                         None)
+        self.assertEqual(self.pool.stats()['hits'], 2)
+        self.assertEqual(self.pool.stats()['misses'], 1)
+
+    def test_claim_skips_failed_and_claimed_stacks(self):
+        self._add('failed', rpc_api.STATUS_CREATE_FAILED)
+        self._add('claimed', rpc_api.STATUS_CREATE_COMPLETE, 'rush-0')
+
+        self.assertEqual(self.pool.claim(self.ctxt, RUSH_TYPE_ID, 'rush-1'),
+                         None)
+        self.assertEqual(self._entries()['claimed'].rush_id, 'rush-0')
+
+    def test_claim_of_a_type_without_pool(self):
+        self._add('complete', rpc_api.STATUS_CREATE_COMPLETE)
+        cfg.CONF.set_override('rush_pool_size', 0)
+
+        self.assertEqual(self.pool.claim(self.ctxt, RUSH_TYPE_ID, 'rush-1'),
+                         None)
+        self.assertEqual(self._entries()['complete'].rush_id, None)
+
+    def test_refresh_updates_the_status_of_the_stacks(self):
+        self._add('creating', rpc_api.STATUS_CREATE_IN_PROGRESS)
+        self._add('complete', rpc_api.STATUS_CREATE_COMPLETE)
+        self.heat.stacks.add('creating', rpc_api.STATUS_CREATE_COMPLETE)
+
+        self.pool.refresh(self.ctxt, self.heat)
+
+        entries = self._entries()
+        self.assertEqual(entries['creating'].status,
+                         rpc_api.STATUS_CREATE_COMPLETE)
+        self.assertEqual(entries['complete'].status,
+                         rpc_api.STATUS_CREATE_COMPLETE)
+        self.assertEqual(self.heat.stacks.deleted, [])
+
+    def test_refresh_drops_failed_stacks(self):
+        self._add('failed', rpc_api.STATUS_CREATE_IN_PROGRESS)
+        self.heat.stacks.add('failed', rpc_api.STATUS_CREATE_FAILED)
+
+        self.pool.refresh(self.ctxt, self.heat)
+
+        self.assertEqual(self._entries(), {})
+        self.assertEqual(self.heat.stacks.deleted, ['failed'])
+
+    def test_refresh_drops_stacks_deleted_out_of_band(self):
+        self._add('gone', rpc_api.STATUS_CREATE_COMPLETE)
+        self._add('unlisted', rpc_api.STATUS_CREATE_IN_PROGRESS)
+        self.heat.stacks.delete('gone')
+        self.heat.stacks.hidden.add('unlisted')
+
+        self.pool.refresh(self.ctxt, self.heat)
+
+        self.assertEqual(self._entries().keys(), ['unlisted'])
+
+    def test_refresh_expires_stale_claims(self):
+        self._add('completed', rpc_api.STATUS_CREATE_COMPLETE, 'rush-1')
+        self._add('abandoned', rpc_api.STATUS_CREATE_COMPLETE, 'rush-2')
+        self._add('recent', rpc_api.STATUS_CREATE_COMPLETE, 'rush-3')
+        utils.create_rush(self.ctxt, 'rush-1', 'tenant', stack_id='completed')
+        self._claimed_long_ago('completed')
+        self._claimed_long_ago('abandoned')
+
+        self.pool.refresh(self.ctxt, self.heat)
+
+        entries = self._entries()
+        self.assertFalse('completed' in entries)
+        self.assertEqual(entries['abandoned'].rush_id, None)
+        self.assertEqual(entries['recent'].rush_id, 'rush-3')
+        pooled = self.pool.claim(self.ctxt, RUSH_TYPE_ID, 'rush-4')
+        self.assertEqual(pooled.id, 'abandoned')
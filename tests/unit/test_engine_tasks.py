@@ -0,0 +1,265 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Claim, run and retry of the rush task queue, on an in-memory SQLite
+database
+"""
+
+import datetime
+import unittest
+
+from oslo.config import cfg
+from sqlalchemy.exc import IntegrityError
+
+from rushstack.common import context
+from rushstack.db import api as db_api
+from rushstack.db.sqlalchemy import models
+from rushstack.db.sqlalchemy import session as db_session
+from rushstack.engine import tasks
+from rushstack.openstack.common import timeutils
+from rushstack.rpc import api as rpc_api
+from tests.unit import utils
+
+TENANT_ID = 'tenant'
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 10
+LEASE = 60
+
+
+class FakeScheduler(object):
+    '''Runs the operations at once, in the calling green thread'''
+
+    def run(self, tenant_id, priority, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    spawn = run
+
+
+class Handler(object):
+    '''Run and fail handlers of an action, failing the first runs'''
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.runs = []
+        self.failed = []
+
+    def run(self, ctxt, task):
+        self.runs.append(task)
+        if len(self.runs) <= self.failures:
+            raise ValueError('run %d failed' % len(self.runs))
+
+    def fail(self, ctxt, task, error):
+        self.failed.append((task, error))
+
+
+class TaskQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        utils.setup_dummy_db()
+        cfg.CONF.set_override('rush_task_max_attempts', MAX_ATTEMPTS)
+        cfg.CONF.set_override('rush_task_retry_delay', RETRY_DELAY)
+        cfg.CONF.set_override('rush_task_lease', LEASE)
+        self.ctxt = context.get_admin_context()
+        self.ctxt.read_from_master = True
+        self.handler = Handler()
+        self.queue = self._queue('engine')
+
+    def tearDown(self):
+        for option in ('rush_task_max_attempts', 'rush_task_retry_delay',
+                       'rush_task_lease'):
+            cfg.CONF.clear_override(option)
+        utils.reset_dummy_db()
+
+    def _queue(self, owner):
+        return tasks.TaskQueue(owner, FakeScheduler(), {
+            rpc_api.TASK_CREATE: (self.handler.run, self.handler.fail)})
+
+    def _create(self, queue=None, claimed=False):
+        task = (queue or self.queue).new_task(rpc_api.TASK_CREATE, 'rush',
+                                              TENANT_ID, {'stack': 'info'},
+                                              claimed=claimed)
+        db_api.rush_task_create(self.ctxt, task)
+        return task['id']
+
+    def _task(self, task_id):
+        return self.ctxt.session.query(models.RushTask).\
+            populate_existing().get(task_id)
+
+    def _retry_due(self, task_id):
+        table = models.RushTask.__table__
+        db_session.get_engine().execute(
+            table.update().where(table.c.id == task_id).
+            values(lease_expires_at=timeutils.utcnow() -
+                   datetime.timedelta(seconds=1)))
+
+    def _delay(self, task_id):
+        '''Seconds until the lease (or retry time) of the task expires'''
+        delta = self._task(task_id).lease_expires_at - timeutils.utcnow()
+        return delta.days * 86400 + delta.seconds
+
+    def test_poll_runs_and_deletes_the_task(self):
+        task_id = self._create()
+
+        self.queue.poll(self.ctxt)
+
+        self.assertEqual(len(self.handler.runs), 1)
+        task = self.handler.runs[0]
+        self.assertEqual(task['payload'], {'stack': 'info'})
+        self.assertEqual(task['attempts'], 1)
+        self.assertEqual(self._task(task_id), None)
+        stats = self.queue.stats()
+        self.assertEqual((stats['claimed'], stats['succeeded'],
+                          stats['active']), (1, 1, 0))
+
+    def test_failed_task_is_retried_with_backoff(self):
+        self.handler.failures = 2
+        task_id = self._create()
+
+        self.queue.poll(self.ctxt)
+        task = self._task(task_id)
+        self.assertEqual(task.state, rpc_api.TASK_PENDING)
+        self.assertEqual(task.attempts, 1)
+        self.assertEqual(task.last_error, 'run 1 failed')
+        self.assertTrue(RETRY_DELAY - 5 <= self._delay(task_id) <=
+                        RETRY_DELAY)
+
+        #Not runnable before its retry time
+        self.queue.poll(self.ctxt)
+        self.assertEqual(len(self.handler.runs), 1)
+
+        self._retry_due(task_id)
+        self.queue.poll(self.ctxt)
+        self.assertEqual(self._task(task_id).attempts, 2)
+        self.assertTrue(2 * RETRY_DELAY - 5 <= self._delay(task_id) <=
+                        2 * RETRY_DELAY)
+
+        self._retry_due(task_id)
+        self.queue.poll(self.ctxt)
+        self.assertEqual(len(self.handler.runs), 3)
+        self.assertEqual(self._task(task_id), None)
+        self.assertEqual(self.handler.failed, [])
+        self.assertEqual(self.queue.stats()['retried'], 2)
+
+    def test_task_fails_after_max_attempts(self):
+        self.handler.failures = MAX_ATTEMPTS
+        task_id = self._create()
+
+        for count in xrange(MAX_ATTEMPTS):
+            self._retry_due(task_id)
+            self.queue.poll(self.ctxt)
+
+        task = self._task(task_id)
+        self.assertEqual(task.state, rpc_api.TASK_FAILED)
+        self.assertEqual(task.lease_expires_at, None)
+        self.assertEqual(len(self.handler.failed), 1)
+        self.assertEqual(str(self.handler.failed[0][1]), 'run 3 failed')
+
+        #Failed tasks are not claimed any more
+        self._retry_due(task_id)
+        self.queue.poll(self.ctxt)
+        self.assertEqual(len(self.handler.runs), MAX_ATTEMPTS)
+
+    def test_expired_lease_is_taken_over(self):
+        task_id = self._create(self._queue('dead'), claimed=True)
+
+        #Held by the other engine until its lease expires
+        self.queue.poll(self.ctxt)
+        self.assertEqual(self.handler.runs, [])
+
+        self._retry_due(task_id)
+        self.queue.poll(self.ctxt)
+        self.assertEqual(len(self.handler.runs), 1)
+        self.assertEqual(self.handler.runs[0]['attempts'], 2)
+        self.assertEqual(self._task(task_id), None)
+
+    def test_run_claimed_runs_the_first_attempt(self):
+        task = self.queue.new_task(rpc_api.TASK_CREATE, 'rush', TENANT_ID,
+                                   {'stack': 'info'}, claimed=True)
+        self.assertEqual((task['state'], task['lease_owner'],
+                          task['attempts']),
+                         (rpc_api.TASK_RUNNING, 'engine', 1))
+        db_api.rush_task_create(self.ctxt, task)
+
+        #Leased to this engine: no poll takes it meanwhile
+        self.queue.poll(self.ctxt)
+        self.assertEqual(self.handler.runs, [])
+
+        self.assertTrue(self.queue.run_claimed(task))
+        self.assertEqual(len(self.handler.runs), 1)
+        self.assertEqual(self._task(task['id']), None)
+        self.assertEqual(self.queue.stats()['active'], 0)
+
+    def test_run_claimed_failure_is_left_to_the_retries(self):
+        self.handler.failures = 1
+        task = self.queue.new_task(rpc_api.TASK_CREATE, 'rush', TENANT_ID,
+                                   {'stack': 'info'}, claimed=True)
+        db_api.rush_task_create(self.ctxt, task)
+
+        self.assertFalse(self.queue.run_claimed(task))
+        self.assertEqual(self._task(task['id']).state, rpc_api.TASK_PENDING)
+        self.assertEqual(self.queue.stats()['active'], 0)
+
+        self._retry_due(task['id'])
+        self.queue.poll(self.ctxt)
+        self.assertEqual(len(self.handler.runs), 2)
+        self.assertEqual(self._task(task['id']), None)
+
+    def test_lost_lease_does_not_run(self):
+        task = self.queue.new_task(rpc_api.TASK_CREATE, 'rush', TENANT_ID,
+                                   {'stack': 'info'}, claimed=True)
+        db_api.rush_task_create(self.ctxt, task)
+        #Taken over by another engine meanwhile
+        db_api.rush_task_update(self.ctxt, task['id'], 'engine',
+                                {'lease_owner': 'other'})
+
+        self.assertFalse(self.queue.run_claimed(task))
+        self.assertEqual(self.handler.runs, [])
+        self.assertEqual(self._task(task['id']).lease_owner, 'other')
+
+
+class CreateForTenantTest(unittest.TestCase):
+
+    def setUp(self):
+        utils.setup_dummy_db()
+        #Make SQLite check the foreign keys, as MySQL InnoDB does
+        db_session.get_engine().execute('PRAGMA foreign_keys = ON')
+        self.ctxt = context.get_admin_context()
+        self.ctxt.read_from_master = True
+
+    def tearDown(self):
+        utils.reset_dummy_db()
+
+    def test_rush_tenant_and_task_are_created_together(self):
+        queue = tasks.TaskQueue('engine', FakeScheduler(), {})
+        task = queue.new_task(rpc_api.TASK_CREATE, 'rush', TENANT_ID, {})
+        utils.create_rush(self.ctxt, 'rush', TENANT_ID)
+        db_api.rush_stack_create_for_tenant(
+            self.ctxt, {'id': 'other', 'name': 'other', 'stack_id': '',
+                        'rush_type_id': 1,
+                        'status': rpc_api.STATUS_CREATE_PENDING},
+            TENANT_ID, dict(task, rush_id='other'))
+
+        rush_ids = sorted(rush.rush_id for rush in
+                          db_api.rush_tenant_get_all_by_tenant(self.ctxt,
+                                                               TENANT_ID))
+        self.assertEqual(rush_ids, ['other', 'rush'])
+        self.assertEqual(db_api.rush_task_get_rush_ids(
+            self.ctxt, rpc_api.TASK_CREATE, (rpc_api.TASK_PENDING,)),
+            ['other'])
+
+    def test_rush_tenant_needs_its_rush(self):
+        self.assertRaises(IntegrityError, db_api.rush_tenant_create,
+                          self.ctxt, {'rush_id': 'missing',
+                                      'tenant_id': TENANT_ID})
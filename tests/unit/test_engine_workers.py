@@ -0,0 +1,74 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Per worker state of the engine when engine_workers forks several of them
+"""
+
+import os
+import unittest
+
+from oslo.config import cfg
+
+from rushstack.db.sqlalchemy import session as db_session
+from rushstack.engine import service
+from rushstack.heatapi import guard
+from rushstack.rpc import api as rpc_api
+from tests.unit import utils
+
+
+class EngineWorkersTest(unittest.TestCase):
+
+    def setUp(self):
+        utils.setup_dummy_db()
+        cfg.CONF.set_override('rush_cache_ttl', 30)
+        cfg.CONF.set_override('rush_cache_shared_ttl', 2)
+
+    def tearDown(self):
+        for option in ('rush_cache_ttl', 'rush_cache_shared_ttl',
+                       'engine_workers'):
+            cfg.CONF.clear_override(option)
+        guard.reset()
+        utils.reset_dummy_db()
+
+    def _cache_ttl(self):
+        engine = service.EngineService('host', rpc_api.ENGINE_TOPIC)
+        return engine.rush_cache._rushes.default_timeout
+
+    def test_single_worker_keeps_the_cache_ttl(self):
+        cfg.CONF.set_override('engine_workers', 1)
+        self.assertEqual(self._cache_ttl(), 30)
+
+    def test_workers_cap_the_cache_ttl(self):
+        cfg.CONF.set_override('engine_workers', 4)
+        self.assertEqual(self._cache_ttl(), 2)
+
+    def test_engine_id_tells_the_workers_apart(self):
+        engine = service.EngineService('host', rpc_api.ENGINE_TOPIC)
+        self.assertEqual(engine.engine_id, 'host.%d' % os.getpid())
+        self.assertEqual(engine.tasks.owner, engine.engine_id)
+        self.assertEqual(engine.leader.owner, engine.engine_id)
+
+    def test_reset_opens_new_connections(self):
+        inherited = db_session.get_engine()
+        db_session.reset()
+        self.assertFalse(db_session.get_engine() is inherited)
+        #The connections of the parent are never closed from the worker
+        self.assertTrue(inherited in db_session._DROPPED_ENGINES)
+
+    def test_reset_forgets_the_endpoint_guards(self):
+        inherited = guard.get_guard('heat')
+        guard.reset()
+        self.assertFalse(guard.get_guard('heat') is inherited)
+        self.assertEqual(guard.stats().keys(), ['heat'])
@@ -0,0 +1,135 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Circuit breaker and adaptive timeouts of the endpoint guard
+"""
+
+import unittest
+
+import eventlet
+from oslo.config import cfg
+
+from rushstack.common import exception
+from rushstack.heatapi import guard
+
+FAILURES = 3
+
+
+class ServerError(Exception):
+    code = 500
+
+
+class ClientError(Exception):
+    code = 404
+
+
+def fail(error=ServerError):
+    raise error()
+
+
+class EndpointGuardTest(unittest.TestCase):
+
+    def setUp(self):
+        cfg.CONF.set_override('endpoint_breaker_failures', FAILURES)
+        self.guard = guard.EndpointGuard('heat')
+
+    def tearDown(self):
+        cfg.CONF.clear_override('endpoint_breaker_failures')
+        cfg.CONF.clear_override('endpoint_timeout_max')
+        guard.reset()
+
+    def _fail(self, times, error=ServerError):
+        for count in xrange(times):
+            self.assertRaises(error, self.guard.call, fail, error)
+
+    def _reset_elapsed(self):
+        self.guard.opened_at -= cfg.CONF.endpoint_breaker_reset + 1
+
+    def test_opens_after_consecutive_failures(self):
+        self._fail(FAILURES - 1)
+        self.assertEqual(self.guard.state, guard.CLOSED)
+        self.assertEqual(self.guard.call(lambda: 'ok'), 'ok')
+        self._fail(FAILURES - 1)
+        self.assertEqual(self.guard.state, guard.CLOSED)
+
+        self._fail(1)
+        self.assertEqual(self.guard.state, guard.OPEN)
+        self.assertRaises(exception.EndpointUnavailable,
+                          self.guard.call, lambda: 'ok')
+        self.assertEqual(self.guard.stats()['rejected'], 1)
+
+    def test_client_errors_are_not_failures(self):
+        self._fail(FAILURES * 2, ClientError)
+        self.assertEqual(self.guard.state, guard.CLOSED)
+        self.assertEqual(self.guard.failures, 0)
+
+    def test_half_open_lets_a_single_probe_through(self):
+        self._fail(FAILURES)
+        self._reset_elapsed()
+        rejected = []
+
+        def probe():
+            #Calls made while the probe runs fail fast, and their
+            #rejection must not free the probe slot for the next ones
+            for count in xrange(2):
+                try:
+                    self.guard.call(lambda: 'ok')
+                except exception.EndpointUnavailable:
+                    rejected.append(count)
+            self.assertEqual(self.guard.state, guard.HALF_OPEN)
+            return 'probed'
+
+        self.assertEqual(self.guard.call(probe), 'probed')
+        self.assertEqual(rejected, [0, 1])
+        self.assertEqual(self.guard.state, guard.CLOSED)
+        self.assertEqual(self.guard.call(lambda: 'ok'), 'ok')
+
+    def test_failed_probe_reopens(self):
+        self._fail(FAILURES)
+        self._reset_elapsed()
+
+        self._fail(1)
+        self.assertEqual(self.guard.state, guard.OPEN)
+        self.assertRaises(exception.EndpointUnavailable,
+                          self.guard.call, lambda: 'ok')
+
+        self._reset_elapsed()
+        self.assertEqual(self.guard.call(lambda: 'ok'), 'ok')
+        self.assertEqual(self.guard.state, guard.CLOSED)
+
+    def test_timeout_counts_as_failure(self):
+        cfg.CONF.set_override('endpoint_timeout_max', 0.01)
+        self.assertRaises(exception.EndpointTimeout,
+                          self.guard.call_operation, 'stacks.list',
+                          eventlet.sleep, 1)
+        self.assertEqual(self.guard.failures, 1)
+        self.assertEqual(self.guard.stats()['timeouts'], 1)
+
+    def test_generators_are_consumed_inside_the_guard(self):
+        result = self.guard.call_operation('stacks.list',
+                                           lambda: (n for n in xrange(3)))
+        self.assertEqual(result, [0, 1, 2])
+
+    def test_timeout_follows_the_latencies_of_the_operation(self):
+        self.assertEqual(self.guard.timeout('stacks.list'),
+                         cfg.CONF.endpoint_timeout_max)
+        for count in xrange(10):
+            self.guard._success('stacks.list', 0.0)
+        self.assertEqual(self.guard.timeout('stacks.list'),
+                         cfg.CONF.endpoint_timeout_min)
+        self.assertEqual(self.guard.timeout('stacks.get'),
+                         cfg.CONF.endpoint_timeout_max)
+        self.assertEqual(self.guard.timeout('stacks.create'),
+                         cfg.CONF.endpoint_write_timeout)
@@ -0,0 +1,130 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+In-memory SQLite database and fake HEAT client for the unit tests
+"""
+
+import itertools
+
+from heatclient import exc as heat_exc
+from oslo.config import cfg
+
+from rushstack.db import api as db_api
+from rushstack.db.sqlalchemy import models
+from rushstack.db.sqlalchemy import session as db_session
+
+TEMPLATE = '{"Resources": {}}'
+
+
+def setup_dummy_db():
+    '''
+    Point the DB API at a new in-memory SQLite database holding the tables
+    of the models
+    '''
+    cfg.CONF.set_override('sql_connection', 'sqlite://')
+    db_api.configure()
+    db_session.reset()
+    models.BASE.metadata.create_all(db_session.get_engine())
+
+
+def reset_dummy_db():
+    db_session.reset()
+    cfg.CONF.clear_override('sql_connection')
+    db_api.configure()
+
+
+def create_rush_type(type_id=1, template=TEMPLATE):
+    session = db_session.get_session()
+    rush_type = models.RushType()
+    rush_type.update({'id': type_id, 'name': 'rush-type-%s' % type_id,
+                      'template': template})
+    rush_type.save(session)
+    return rush_type
+
+
+def create_rush(ctxt, rush_id, tenant_id, status='CREATE_COMPLETE',
+                stack_id=None, url=None):
+    return db_api.rush_stack_create_for_tenant(
+        ctxt, {'id': rush_id, 'name': rush_id,
+               'stack_id': rush_id if stack_id is None else stack_id,
+               'rush_type_id': 1, 'status': status, 'url': url},
+        tenant_id)
+
+
+class FakeStack(object):
+
+    def __init__(self, info):
+        self._info = info
+
+
+class FakeStackManager(object):
+    '''
+    Stacks of the fake HEAT client. The hidden ones are not listed, the
+    way HEAT leaves the deleted stacks out of the list while a get still
+    finds them for a while.
+    '''
+
+    def __init__(self):
+        self.stacks = {}
+        self.hidden = set()
+        self.created = []
+        self.deleted = []
+        self._ids = itertools.count(1)
+
+    def add(self, stack_id, status, stack_name=None):
+        self.stacks[stack_id] = {'id': stack_id,
+                                 'stack_name': stack_name or stack_id,
+                                 'stack_status': status,
+                                 'links': []}
+
+    def list(self, filters=None):
+        name = (filters or {}).get('stack_name')
+        return [FakeStack(dict(info)) for stack_id, info in
+                sorted(self.stacks.iteritems())
+                if stack_id not in self.hidden and
+                (name is None or info['stack_name'].startswith(name))]
+
+    def get(self, stack_id):
+        if stack_id not in self.stacks:
+            raise heat_exc.HTTPNotFound()
+        return FakeStack(dict(self.stacks[stack_id]))
+
+    def create(self, **kwargs):
+        stack_id = 'stack-%d' % self._ids.next()
+        self.add(stack_id, 'CREATE_IN_PROGRESS', kwargs['stack_name'])
+        self.created.append(kwargs)
+        return {'stack': {'id': stack_id, 'links': []}}
+
+    def delete(self, stack_id):
+        if stack_id not in self.stacks:
+            raise heat_exc.HTTPNotFound()
+        del self.stacks[stack_id]
+        self.deleted.append(stack_id)
+
+
+class FakeHeatClient(object):
+    '''
+    HEAT client lent by EngineService._heat: use the instance itself as
+    the context manager
+    '''
+
+    def __init__(self):
+        self.stacks = FakeStackManager()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False